@@ -1,32 +1,3 @@
-let socket = null;
-
-function startWebSocket() {
-  if (socket && socket.readyState === WebSocket.OPEN) {
-    console.warn("WebSocket is already open.");
-    socket.send(JSON.stringify({ action: "startTranscription" }));
-    return;
-  }
-
-  console.log("Opening WebSocket connection...");
-  socket = new WebSocket("ws://localhost:8765");
-
-  socket.onopen = () => {
-    socket.send(JSON.stringify({ action: "startTranscription" }));
-    console.log("WebSocket connection established.");
-  };
-  socket.onerror = (err) => console.error("WebSocket error:", err);
-  socket.onclose = () => {
-    console.log("WebSocket connection closed.");
-    socket = null;
-  };
-}
-
-function stopWebSocket() {
-  socket.send(JSON.stringify({ action: "endTranscription" }));
-  console.log("WebSocket connection closed.");
-  socket = null;
-}
-
 chrome.action.onClicked.addListener(async (tab) => {
   console.log("Extension icon clicked. Tab info:", tab);
 
@@ -43,7 +14,6 @@ chrome.action.onClicked.addListener(async (tab) => {
   // If an offscreen document is not already open, create one.
   if (!offscreenDocument) {
     console.log("No offscreen document found. Creating a new one...");
-    startWebSocket();
     await chrome.offscreen.createDocument({
       url: "offscreen/offscreen.html",
       reasons: ["USER_MEDIA"],
@@ -63,7 +33,10 @@ chrome.action.onClicked.addListener(async (tab) => {
     console.log(
       "Recording is active. Sending stop message to offscreen document."
     );
-    stopWebSocket();
+    await chrome.runtime.sendMessage({
+      type: "stop-recording",
+      target: "offscreen",
+    });
     if (await chrome.offscreen.hasDocument()) {
       await chrome.offscreen.closeDocument();
       console.log("Offscreen document closed.");
@@ -111,3 +84,11 @@ function updateCaption(text) {
     }
   });
 }
+
+chrome.runtime.onMessage.addListener((message) => {
+  if (message.target === "background" && message.type === "update-caption") {
+    const { text, context, speaker } = message.data;
+    const caption = context ? `${text} ${context}` : text;
+    updateCaption(speaker ? `${speaker}:${caption}` : caption);
+  }
+});
@@ -4,6 +4,9 @@ chrome.runtime.onMessage.addListener(async (message) => {
       case "start-recording":
         startRecording(message.data);
         break;
+      case "stop-recording":
+        stopRecording();
+        break;
       default:
         throw new Error("Unrecognized message:", message.type);
     }
@@ -14,6 +17,22 @@ let socket = null;
 let audioCtx = null;
 let audioWorkletNode = null;
 let sourceNode = null;
+const captions = new Map(); // segment id -> caption state from the server
+const MAX_CAPTIONS = 50;
+
+// Framed audio protocol, see server/audio_protocol.py. Audio is sent at the
+// AudioContext's native rate and resampled to 16 kHz by the server.
+const OPUS_SAMPLE_RATE = 48000; // Opus only encodes 8/12/16/24/48 kHz, so pin the context rate for it
+const FRAMES_PER_MESSAGE = 5; // 100 ms of audio per websocket message
+const AUDIO_CODECS = { pcm16: 0, opus: 1 };
+const PREFERRED_CODEC = "pcm16"; // "opus" needs WebCodecs here and opuslib on the server
+let audioCodec = "pcm16";
+let sampleRate = OPUS_SAMPLE_RATE;
+let frameSamples = OPUS_SAMPLE_RATE / 50; // 20 ms frames from the worklet
+let opusEncoder = null;
+let opusFrames = []; // {seq, time} of frames waiting in the Opus encoder
+let pendingFrames = [];
+let frameSeq = 0;
 
 async function startRecording(streamId) {
   // If we already have a context, skip
@@ -22,10 +41,9 @@ async function startRecording(streamId) {
     return;
   }
 
-  // 1) Start WebSocket
-  startWebSocket();
+  audioCodec = PREFERRED_CODEC === "opus" && typeof AudioEncoder !== "undefined" ? "opus" : "pcm16";
 
-  // 2) Capture tab audio
+  // 1) Capture tab audio
   const mediaStream = await navigator.mediaDevices.getUserMedia({
     audio: {
       mandatory: {
@@ -35,11 +53,16 @@ async function startRecording(streamId) {
     },
   });
 
-  const inputSampleRate = 48000;
+  // 2) Create AudioContext at the device's native rate (no browser resampling) and
+  //    start the WebSocket, which declares that rate to the server
+  audioCtx = new AudioContext(audioCodec === "opus" ? { sampleRate: OPUS_SAMPLE_RATE } : {});
+  sampleRate = audioCtx.sampleRate;
+  frameSamples = Math.round(sampleRate / 50);
+  console.log("Sample rate:", sampleRate);
+  if (audioCodec === "opus") opusEncoder = createOpusEncoder();
+  startWebSocket();
 
-  // 3) Create AudioContext and load our AudioWorklet module
-  audioCtx = new AudioContext({ sampleRate: inputSampleRate });
-  console.log("Sample rate:", audioCtx.sampleRate);
+  // 3) Load our AudioWorklet module
 
   await audioCtx.audioWorklet.addModule(
     chrome.runtime.getURL("offscreen/pcm-worklet.js")
@@ -54,16 +77,30 @@ async function startRecording(streamId) {
     numberOfOutputs: 1, // 1 output to the user
     outputChannelCount: [2], // Stereo output
     processorOptions: {
-      inputSampleRate,
+      inputSampleRate: sampleRate,
     },
   });
 
   // 6) Listen for audio data messages from the AudioWorkletProcessor
   audioWorkletNode.port.onmessage = (event) => {
     if (!socket || socket.readyState !== WebSocket.OPEN) return;
-    const floatSamples = event.data; // Mono samples received
-    const int16Samples = convertFloat32ToInt16(floatSamples);
-    socket.send(int16Samples);
+    const { samples, time } = event.data; // 20 ms of mono samples and their capture time
+    const seq = frameSeq++;
+    if (opusEncoder) {
+      opusFrames.push({ seq, time });
+      opusEncoder.encode(
+        new AudioData({
+          format: "f32",
+          sampleRate,
+          numberOfFrames: samples.length,
+          numberOfChannels: 1,
+          timestamp: Math.round(time * 1e6),
+          data: samples,
+        })
+      );
+    } else {
+      queueFrame(seq, time, samples.length, convertFloat32ToInt16(samples));
+    }
   };
 
   // 7) Connect the graph: source -> worklet -> destination
@@ -85,6 +122,68 @@ function convertFloat32ToInt16(float32Array) {
   return int16Buffer;
 }
 
+function createOpusEncoder() {
+  const encoder = new AudioEncoder({
+    // Opus emits one packet per 20 ms input frame, in order
+    output: (chunk) => {
+      const { seq, time } = opusFrames.shift();
+      const payload = new Uint8Array(chunk.byteLength);
+      chunk.copyTo(payload);
+      queueFrame(seq, time, frameSamples, payload);
+    },
+    error: (err) => console.error("Opus encoder error:", err),
+  });
+  encoder.configure({
+    codec: "opus",
+    sampleRate,
+    numberOfChannels: 1,
+    bitrate: 24000,
+    opus: { frameDuration: 20000 },
+  });
+  return encoder;
+}
+
+function queueFrame(seq, time, sampleCount, payload) {
+  pendingFrames.push({
+    seq,
+    time,
+    sampleCount,
+    payload: new Uint8Array(payload.buffer, payload.byteOffset, payload.byteLength),
+  });
+  if (pendingFrames.length >= FRAMES_PER_MESSAGE) flushFrames();
+}
+
+// Packs the pending frames into one binary message:
+// u8 version, u8 codec, u16 frame count, then per frame
+// u32 seq, f64 capture time, u16 sample count, u16 payload bytes, payload (little endian)
+function flushFrames() {
+  if (!pendingFrames.length) return;
+  if (!socket || socket.readyState !== WebSocket.OPEN) {
+    pendingFrames = [];
+    return;
+  }
+
+  const size = pendingFrames.reduce((total, frame) => total + 16 + frame.payload.byteLength, 4);
+  const buffer = new ArrayBuffer(size);
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  view.setUint8(0, 1);
+  view.setUint8(1, AUDIO_CODECS[audioCodec]);
+  view.setUint16(2, pendingFrames.length, true);
+
+  let offset = 4;
+  for (const frame of pendingFrames) {
+    view.setUint32(offset, frame.seq, true);
+    view.setFloat64(offset + 4, frame.time, true);
+    view.setUint16(offset + 12, frame.sampleCount, true);
+    view.setUint16(offset + 14, frame.payload.byteLength, true);
+    bytes.set(frame.payload, offset + 16);
+    offset += 16 + frame.payload.byteLength;
+  }
+  socket.send(buffer);
+  pendingFrames = [];
+}
+
 function startWebSocket() {
   if (socket && socket.readyState === WebSocket.OPEN) {
     console.warn("WebSocket is already open.");
@@ -94,10 +193,70 @@ function startWebSocket() {
   console.log("Opening WebSocket connection...");
   socket = new WebSocket("ws://localhost:8765");
 
-  socket.onopen = () => console.log("WebSocket connection established.");
+  // Control messages share the audio socket so the server keeps them in one session
+  socket.onopen = () => {
+    socket.send(
+      JSON.stringify({
+        action: "startTranscription",
+        audio: { format: "framed", codec: audioCodec, sampleRate, channels: 1 },
+      })
+    );
+    console.log("WebSocket connection established.");
+  };
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type === "captions") applyCaptionOps(message.ops);
+    else if (message.type === "error") console.error("Server error:", message.message);
+  };
   socket.onerror = (err) => console.error("WebSocket error:", err);
   socket.onclose = () => {
     console.log("WebSocket connection closed.");
     socket = null;
   };
 }
+
+function stopRecording() {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    flushFrames();
+    socket.send(JSON.stringify({ action: "endTranscription" }));
+  }
+  window.location.hash = "";
+}
+
+// Applies incremental caption ops (add / update / remove) and forwards the latest line
+function applyCaptionOps(ops) {
+  for (const op of ops) {
+    switch (op.op) {
+      case "add":
+        captions.set(op.id, op);
+        break;
+      case "update": {
+        const caption = captions.get(op.id);
+        if (!caption) break;
+        const { text, text_from, ...fields } = op;
+        if (text_from !== undefined) {
+          caption.text = caption.text.slice(0, text_from) + text;
+        }
+        Object.assign(caption, fields);
+        break;
+      }
+      case "remove":
+        captions.delete(op.id);
+        break;
+    }
+  }
+
+  // Final captions never change again, so only keep the most recent ones around
+  for (const [id, caption] of captions) {
+    if (captions.size <= MAX_CAPTIONS) break;
+    if (caption.final) captions.delete(id);
+  }
+
+  const latest = Array.from(captions.values()).pop();
+  if (!latest) return;
+  chrome.runtime.sendMessage({
+    type: "update-caption",
+    target: "background",
+    data: latest,
+  });
+}
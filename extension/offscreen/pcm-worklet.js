@@ -1,11 +1,11 @@
 class PCMWorkletProcessor extends AudioWorkletProcessor {
   constructor() {
     super();
-    this.inputSampleRate = 48000; // Input sample rate
-    this.outputSampleRate = 16000; // Target sample rate
-    this.resampleFactor = this.inputSampleRate / this.outputSampleRate; // Downsample ratio
-    this.chunkSize = this.outputSampleRate / 100; // 20ms sample rate
-    this.buffer = []; // Buffer to store accumulated samples
+    this.inputSampleRate = sampleRate; // AudioContext sample rate, sent as is; the server resamples to 16 kHz
+    this.frameSize = Math.round(this.inputSampleRate / 50); // 20 ms frames
+    this.frame = new Float32Array(this.frameSize); // Frame being filled
+    this.frameLength = 0;
+    this.frameTime = 0; // Audio clock time (seconds) of the frame's first sample
   }
 
   process(inputs, outputs) {
@@ -31,15 +31,18 @@ class PCMWorkletProcessor extends AudioWorkletProcessor {
         monoSamples[i] = (leftChannel[i] + rightChannel[i]) / 2; // Average left and right channels
       }
 
-      // Resample to 16 kHz by selecting every Nth sample (N = resampleFactor)
-      for (let i = 0; i < monoSamples.length; i += this.resampleFactor) {
-        this.buffer.push(monoSamples[Math.floor(i)]);
-      }
-
-      // Send resampled chunks to the main thread
-      while (this.buffer.length >= this.chunkSize) {
-        const chunk = this.buffer.splice(0, this.chunkSize); // Extract a 20ms chunk
-        this.port.postMessage(chunk); // Send the chunk to the main thread
+      for (let i = 0; i < monoSamples.length; i++) {
+        if (this.frameLength === 0) {
+          this.frameTime = currentTime + i / this.inputSampleRate;
+        }
+        this.frame[this.frameLength++] = monoSamples[i];
+
+        // Hand each full 20 ms frame to the main thread with its capture time (transferred, not copied)
+        if (this.frameLength === this.frameSize) {
+          this.port.postMessage({ samples: this.frame, time: this.frameTime }, [this.frame.buffer]);
+          this.frame = new Float32Array(this.frameSize);
+          this.frameLength = 0;
+        }
       }
     } else {
       // No input data? Fill outputs with silence
@@ -0,0 +1,143 @@
+"""
+ASR backends share one interface:
+
+    transcribe(window, initial_prompt=None, **options) -> {"text": str, "segments": [{"start", "end", "text", "words": [...]}]}
+    transcribe_batch(windows, prompts=None, word_timestamps=False) -> [result, ...]
+    stats() -> {"decodes": int, "fallbacks": int}
+
+`window` is a float32 16 kHz mono array of at most 30 s and times are relative
+to its first sample, matching openai-whisper's transcribe() output. `prompts`
+holds one initial_prompt (text preceding the window) or None per window, and
+"fallbacks" counts windows that needed a temperature fallback re-decode.
+"""
+import time
+import numpy as np
+
+class FasterWhisperModel:
+    """CTranslate2 (faster-whisper) backend; int8 on CPU is several times faster than openai-whisper."""
+    def __init__(self, model_name="small", device="cpu", compute_type="int8", download_root=None):
+        from faster_whisper import WhisperModel as CTranslate2Whisper  # Optional dependency
+        self.device = device
+        self.model = CTranslate2Whisper(model_name, device=device, compute_type=compute_type, download_root=download_root)
+        self.decodes = 0
+        self.fallbacks = 0
+
+    def transcribe(self, audio, word_timestamps=False, initial_prompt=None, **options):
+        segments, _ = self.model.transcribe(
+            np.asarray(audio, dtype=np.float32),
+            language="en",
+            word_timestamps=word_timestamps,
+            initial_prompt=initial_prompt,
+            condition_on_previous_text=False,
+            beam_size=options.get("beam_size", 1)
+        )
+        result_segments = []
+        fell_back = False
+        for segment in segments:
+            fell_back = fell_back or segment.temperature > 0
+            result_segments.append({
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "words": [
+                    {"word": word.word, "start": word.start, "end": word.end, "probability": word.probability}
+                    for word in (segment.words or [])
+                ]
+            })
+        self.decodes += 1
+        self.fallbacks += fell_back
+        return {"text": "".join(s["text"] for s in result_segments), "segments": result_segments, "language": "en"}
+
+    def transcribe_batch(self, windows, prompts=None, word_timestamps=False):
+        prompts = prompts or [None] * len(windows)
+        return [
+            self.transcribe(window, word_timestamps=word_timestamps, initial_prompt=prompt)
+            for window, prompt in zip(windows, prompts)
+        ]
+
+    def stats(self):
+        return {"decodes": self.decodes, "fallbacks": self.fallbacks}
+
+class StubASRModel:
+    """
+    Deterministic backend for tests and benchmarks without a GPU or model weights.
+
+    Every run of 20 ms frames above `threshold_db` becomes one word, labelled with its
+    median zero-crossing rate so different sounds give different words. The output
+    depends only on the audio and stays stable as decode windows slide. Decode cost
+    is simulated as `latency + rtf * window duration` seconds.
+    """
+    SAMPLE_RATE = 16000
+    FRAME = 320  # 20 ms
+
+    def __init__(self, latency=0.0, rtf=0.0, threshold_db=-40.0, word="speech"):
+        self.device = "cpu"
+        self.latency = latency
+        self.rtf = rtf
+        self.threshold_db = threshold_db
+        self.word = word
+        self.calls = 0
+
+    def transcribe(self, audio, word_timestamps=False, initial_prompt=None, **options):
+        self.calls += 1
+        audio = np.asarray(audio, dtype=np.float32)
+        time.sleep(self.latency + self.rtf * len(audio) / self.SAMPLE_RATE)
+
+        count = len(audio) // self.FRAME
+        frames = audio[:count * self.FRAME].reshape(count, self.FRAME)
+        loud = 20 * np.log10(np.sqrt(np.mean(frames * frames, axis=1)) + 1e-10) > self.threshold_db
+        crossings = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1)
+
+        # Rising and falling edges of the loud mask delimit words
+        edges = np.diff(np.concatenate([[False], loud, [False]]).astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        words = [
+            {"word": f" {self.word}{int(np.median(crossings[start:end])) // 4}",
+             "start": float(start * self.FRAME / self.SAMPLE_RATE),
+             "end": float(end * self.FRAME / self.SAMPLE_RATE), "probability": 1.0}
+            for start, end in zip(starts, ends)
+        ]
+        if not words:
+            return {"text": "", "segments": [], "language": "en"}
+
+        segment = {
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "text": "".join(w["word"] for w in words)
+        }
+        if word_timestamps:
+            segment["words"] = words
+        return {"text": segment["text"], "segments": [segment], "language": "en"}
+
+    def transcribe_batch(self, windows, prompts=None, word_timestamps=False):
+        return [self.transcribe(window, word_timestamps=word_timestamps) for window in windows]
+
+    def stats(self):
+        return {"decodes": self.calls, "fallbacks": 0}
+
+def resolve_device(device):
+    if device != "auto":
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_asr_model(asr_config, cache_dir=None):
+    """Builds the ASR backend described by the "asr" section of the server config."""
+    backend = asr_config.get("backend", "whisper")
+    compute_type = asr_config.get("compute_type", "auto")
+
+    if backend == "stub":
+        return StubASRModel(latency=asr_config.get("latency", 0.0), rtf=asr_config.get("rtf", 0.0))
+
+    device = resolve_device(asr_config.get("device", "auto"))
+    if backend == "whisper":
+        from whisper_model import WhisperModel  # Imported lazily so CPU nodes need not install openai-whisper
+        fp16 = compute_type == "float16" or (compute_type == "auto" and device == "cuda")
+        return WhisperModel(asr_config.get("model", "turbo"), device=device, fp16=fp16, download_root=cache_dir)
+    if backend == "faster-whisper":
+        if compute_type == "auto":
+            compute_type = "float16" if device == "cuda" else "int8"
+        return FasterWhisperModel(asr_config.get("model", "small"), device=device, compute_type=compute_type,
+                                  download_root=cache_dir)
+    raise ValueError(f"Unknown ASR backend: {backend}")
@@ -1,129 +1,98 @@
-import pyaudio
-import webrtcvad
+import os
 import numpy as np
-import librosa
 import torch
-import torch.nn.functional as F
 from datetime import timedelta
-from speechbrain.inference import SpeakerRecognition
-from manager_llm import Manager_LLM
+from context_annotator import ContextAnnotator
+from vad import VadStage, VAD_BACKENDS
+from speaker_index import SpeakerIndex
+from resampler import StreamingResampler
 
 class AudioProcessor:
     WHISPER_SAMPLE_RATE = 16000  # Whisper expects 16kHz
     CHANNELS = 1  # Mono audio
-    FORMAT = pyaudio.paInt16  # 16-bit PCM
     PHRASE_TIMEOUT = 2  # Silence duration to determine a new phrase
 
-    def __init__(self):
-        self.vad = webrtcvad.Vad()
-        self.vad.set_mode(3)  
-
-        # Load ECAPA-TDNN for speaker embeddings (GPU optimized)
+    def __init__(self, vad_backend="webrtc", llm_config=None, cache_dir=None, max_speakers=32, speaker_index_path=None):
+        self.vad_backend = vad_backend
+        self.llm_config = llm_config or {}
+        self.cache_dir = cache_dir
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.speaker_model = None  # Loaded by load_speaker_model()
+
+        self.speaker_dim = 192  
+        self.similarity_threshold = 0.5
+        # 🔹 Store multiple prototypes per speaker; progressive relaxation for close matches
+        self.max_speakers = max_speakers
+        self.speaker_index_path = speaker_index_path  # Known speakers shared across sessions, None for per-session speakers
+        self.manager_llm = None  # Loaded by load_context_annotator()
+        self.context_annotator = None
+
+    def load_speaker_model(self):
+        """Loads ECAPA-TDNN for speaker embeddings (GPU optimized)."""
+        from speechbrain.inference import SpeakerRecognition  # Imported lazily, it is slow to import
         self.speaker_model = SpeakerRecognition.from_hparams(
             source="speechbrain/spkrec-ecapa-voxceleb",
+            savedir=os.path.join(self.cache_dir, "spkrec-ecapa-voxceleb") if self.cache_dir else None,
             run_opts={"device": self.device}
         )
+        return self.speaker_model
 
-        self.speaker_dim = 192  
-        self.speaker_embeddings = {}  # 🔹 Store multiple embeddings per speaker
-        self.speaker_history = {}
-        self.next_speaker_id = 0
-        self.similarity_threshold = 0.5
-        self.manager_llm = Manager_LLM()
-
-    def is_speech(self, audio_chunk, sample_rate):
-        """Check if the audio contains speech using WebRTC VAD."""
-        frame_duration_ms = (len(audio_chunk) / (sample_rate / 1000))
-        if frame_duration_ms not in [10, 20, 30]:
-            return False
-        return self.vad.is_speech(audio_chunk, sample_rate)
-
-    def extract_speaker_embedding(self, audio):
-        """Extracts and normalizes speaker embedding."""
-        min_duration_samples = self.WHISPER_SAMPLE_RATE * 3
-        audio = librosa.util.fix_length(audio, size=min_duration_samples)
-        audio_tensor = torch.tensor(audio).unsqueeze(0).to(self.device)
-        embedding = self.speaker_model.encode_batch(audio_tensor).squeeze(0).detach()
-
-        if embedding.dim() == 1:  
-            embedding = embedding.unsqueeze(0)
-        elif embedding.dim() == 3:  
-            embedding = embedding.squeeze(0)
-
-        embedding = torch.nn.functional.normalize(embedding, p=2, dim=-1)
-        return embedding.view(1, -1)  
-
-    def find_closest_speaker(self, embedding):
-        """Find the closest speaker using cosine similarity with adaptive thresholding."""
-        if not self.speaker_embeddings:
-            return None, 0.0  
-
-        best_match = None
-        best_similarity = 0.0
-
-        for speaker_id, stored_embeddings in self.speaker_embeddings.items():
-            similarities = F.cosine_similarity(embedding, stored_embeddings)
-            max_sim = torch.max(similarities).item()  
-
-            if max_sim > best_similarity:
-                best_similarity = max_sim
-                best_match = speaker_id
+    def load_context_annotator(self):
+        """Loads the context LLM and wraps it in the shared ContextAnnotator."""
+        from manager_llm import load_llm  # Imported lazily so transformers is only imported when needed
+        self.manager_llm = load_llm(self.llm_config, cache_dir=self.cache_dir)
+        self.context_annotator = ContextAnnotator(self.manager_llm)
+        return self.context_annotator
 
-        # 🔹 Use progressive relaxation for close matches
-        adjusted_threshold = self.similarity_threshold - 0.1  
-        if best_similarity >= adjusted_threshold:
-            return best_match, best_similarity  
+    def create_vad(self):
+        """Creates a per-session VAD stage using the configured backend ("webrtc" or "energy")."""
+        return VadStage(VAD_BACKENDS[self.vad_backend](), self.WHISPER_SAMPLE_RATE)
 
-        return None, best_similarity  
+    def create_resampler(self, sample_rate, channels=1):
+        """Creates a per-session resampler from the client's declared format to 16 kHz mono."""
+        return StreamingResampler(sample_rate, self.WHISPER_SAMPLE_RATE, channels)
 
-    def update_speaker_embedding(self, speaker_id, new_embedding):
-        """Averages new embeddings with previous ones for stability."""
-        if speaker_id not in self.speaker_embeddings:
-            self.speaker_embeddings[speaker_id] = new_embedding
-        else:
-            # 🔹 Running average to smooth variations
-            self.speaker_embeddings[speaker_id] = (
-                self.speaker_embeddings[speaker_id] * 0.7 + new_embedding * 0.3
-            )
-
-    def diarize_speaker(self, raw_data, start_time):
-        """Processes audio and assigns speaker IDs using cosine similarity."""
-        samples = np.frombuffer(raw_data, dtype=np.int16).astype(np.float32) / 32768.0
-        embedding = self.extract_speaker_embedding(samples)
-        if embedding is None:
-            return self.speaker_history
-        
-        embedding = embedding.view(1, -1)  
-        matched_speaker, similarity = self.find_closest_speaker(embedding)
-
-        if matched_speaker is None:
-            speaker_id = f"SPEAKER_{self.next_speaker_id}"
-            self.speaker_embeddings[speaker_id] = embedding  
-            self.next_speaker_id += 1
-        else:
-            speaker_id = matched_speaker
-            self.update_speaker_embedding(speaker_id, embedding)  
+    def create_speaker_index(self):
+        """
+        Creates a speaker index with the processor's thresholds for one session or
+        recording, holding the known speakers saved at speaker_index_path if any.
+        """
+        index = SpeakerIndex(self.speaker_dim, similarity_threshold=self.similarity_threshold - 0.1,
+                             max_speakers=self.max_speakers, device=self.device)
+        if self.speaker_index_path and os.path.exists(self.speaker_index_path):
+            try:
+                index.load(self.speaker_index_path)
+            except Exception as e:
+                print(f"Could not load known speakers from {self.speaker_index_path}, starting empty: {e}")
+        return index
+
+    def save_speaker_index(self, index):
+        """Saves a session's speakers to speaker_index_path so the next session recognizes them."""
+        if not self.speaker_index_path:
+            return
+        try:
+            index.save(self.speaker_index_path)
+        except Exception as e:
+            print(f"Could not save known speakers to {self.speaker_index_path}: {e}")
 
-        formatted_start = self.format_time(start_time)
-        formatted_end = self.format_time(start_time + timedelta(seconds=len(samples) / self.WHISPER_SAMPLE_RATE))
+    def extract_speaker_embeddings(self, clips):
+        """
+        Embeds several float32 clips with one encode_batch call. Clips are padded to the
+        longest one and wav_lens masks the padding, instead of padding each to 3 s.
+        """
+        lengths = torch.tensor([len(clip) for clip in clips], dtype=torch.float32)
+        batch = torch.zeros((len(clips), int(lengths.max())), dtype=torch.float32)
+        for i, clip in enumerate(clips):
+            batch[i, :len(clip)] = torch.from_numpy(np.asarray(clip, dtype=np.float32))
 
-        if speaker_id not in self.speaker_history:
-            self.speaker_history[speaker_id] = {"time_segments": []}
+        with torch.inference_mode():
+            embeddings = self.speaker_model.encode_batch(batch.to(self.device), (lengths / lengths.max()).to(self.device))
+        return torch.nn.functional.normalize(embeddings.view(len(clips), -1), p=2, dim=-1)
 
-        self.speaker_history[speaker_id]["time_segments"].append({
-            "start_time": formatted_start,
-            "end_time": formatted_end,
-            "similarity": similarity
-        })
+    def diarize_clips(self, clips, speaker_index):
+        """Assigns a speaker to each clip; returns (speaker_id, similarity) pairs."""
+        return speaker_index.assign(self.extract_speaker_embeddings(clips))
 
-        return self.speaker_history
-    
-    def preprocess_audio(self, raw_data):
-        samples = np.frombuffer(raw_data, dtype=np.int16).astype(np.float32) / 32768.0
-        target_length = self.WHISPER_SAMPLE_RATE * 30
-        return librosa.util.fix_length(samples, size=target_length)
-    
     @staticmethod
     def format_time(delta_seconds):
         if isinstance(delta_seconds, timedelta):
@@ -132,35 +101,3 @@ class AudioProcessor:
         minutes = int((delta_seconds % 3600) // 60)
         seconds = delta_seconds % 60
         return f"{hours:02}:{minutes:02}:{seconds:06.3f}"
-
-    def process_time_segments(self, phrase_timestamp, segments):
-        transcript_obj = []
-        for segment in segments:
-            start_time = phrase_timestamp + timedelta(seconds=segment['start'])
-            end_time = phrase_timestamp + timedelta(seconds=segment['end'])
-            formatted_start = self.format_time(start_time)
-            formatted_end = self.format_time(end_time)
-            transcript_obj.append({"text": segment['text'], "start": formatted_start, "end": formatted_end, "context": ""})
-        return transcript_obj
-    
-    def add_context_w_llm(self, caption, history):
-        """
-        Adds the context to caption from the LLM based on the prompt given in llm_prompt.txt.
-        """
-        try: 
-            with open("llm_prompt.txt", "r") as file:
-                prompt_template = file.read()
-            prompt = prompt_template.format(caption=caption, history=history) # format with caption inserted at end of prompt
-
-            response = self.manager_llm.generate_response(prompt)
-            return response
-        
-        except Exception as e:
-            print(f"exeption: {e}")
-        except FileNotFoundError:
-            raise FileNotFoundError("The prompt file 'llm_prompt.txt' was not found.")
-
-        
-        
-        
-    
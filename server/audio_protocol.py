@@ -0,0 +1,106 @@
+import struct
+import numpy as np
+
+AUDIO_CODECS = {"pcm16": 0, "opus": 1, "f32": 2}
+SAMPLE_TYPES = {"pcm16": np.int16, "opus": np.int16, "f32": np.float32}
+
+class AudioFrameDecoder:
+    """
+    Decodes framed binary audio messages from the extension.
+
+    Each websocket message batches several frames of audio at the rate and channel
+    count declared in startTranscription (16 kHz mono unless stated):
+
+        message header   u8 version, u8 codec (0 = pcm16, 1 = opus, 2 = f32), u16 frame count
+        per frame        u32 sequence number, f64 capture time (seconds on the client's
+                         audio clock), u16 samples per channel, u16 payload bytes, payload
+
+    All fields are little endian. pcm16 and f32 payloads are interleaved int16 or
+    float32 samples; opus payloads are single Opus packets decoded with opuslib
+    (optional dependency). Samples are returned as sent; the session resamples
+    them to 16 kHz mono. Gaps in the sequence numbers are counted as lost frames.
+    """
+    VERSION = 1
+    MESSAGE_HEADER = struct.Struct("<BBH")
+    FRAME_HEADER = struct.Struct("<IdHH")
+
+    def __init__(self, codec="pcm16", sample_rate=16000, channels=1):
+        if codec not in AUDIO_CODECS:
+            raise ValueError(f"Unknown audio codec: {codec}")
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dtype = SAMPLE_TYPES[codec]
+        self.opus = None
+        if codec == "opus":
+            import opuslib  # Optional dependency, only needed for compressed audio
+            self.opus = opuslib.Decoder(sample_rate, channels)
+        self.next_seq = None
+        self.frames = 0
+        self.lost = 0
+        self.bytes = 0
+
+    def decode(self, message):
+        """Returns [(sequence number, capture time, interleaved samples)] for the frames in one message."""
+        version, codec, count = self.MESSAGE_HEADER.unpack_from(message, 0)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported audio frame version {version}")
+        if codec != AUDIO_CODECS[self.codec]:
+            raise ValueError(f"Expected {self.codec} audio frames, got codec {codec}")
+
+        self.bytes += len(message)
+        view = memoryview(message)
+        frames = []
+        offset = self.MESSAGE_HEADER.size
+        for _ in range(count):
+            seq, capture_time, samples, size = self.FRAME_HEADER.unpack_from(message, offset)
+            offset += self.FRAME_HEADER.size
+            payload = view[offset:offset + size]
+            offset += size
+
+            if self.next_seq is not None and seq != self.next_seq:
+                self.lost += max(0, seq - self.next_seq)
+            self.next_seq = seq + 1
+            self.frames += 1
+
+            if self.opus is not None:
+                pcm = np.frombuffer(self.opus.decode(bytes(payload), samples), dtype=np.int16)
+            else:
+                pcm = np.frombuffer(payload, dtype=self.dtype)
+            frames.append((seq, capture_time, pcm))
+        return frames
+
+    @staticmethod
+    def join(frames):
+        """
+        Merges consecutive frames into contiguous runs so the VAD sees one array per run
+        instead of one per 20 ms frame. Returns [(capture time, samples)].
+        """
+        runs = []
+        run_seq = run_time = None
+        parts = []
+        for seq, capture_time, pcm in frames:
+            if parts and seq != run_seq + len(parts):
+                runs.append((run_time, np.concatenate(parts)))
+                parts = []
+            if not parts:
+                run_seq, run_time = seq, capture_time
+            parts.append(pcm)
+        if parts:
+            runs.append((run_time, np.concatenate(parts)))
+        return runs
+
+    def stats(self):
+        return {"codec": self.codec, "sample_rate": self.sample_rate, "channels": self.channels,
+                "frames": self.frames, "lost": self.lost, "bytes": self.bytes}
+
+def encode_message(frames, codec="pcm16", channels=1):
+    """Packs [(sequence number, capture time, interleaved samples)] pcm16 or f32 frames into one message (used by test clients)."""
+    if codec == "opus":
+        raise ValueError("Only pcm16 and f32 frames can be encoded here")
+    parts = [AudioFrameDecoder.MESSAGE_HEADER.pack(AudioFrameDecoder.VERSION, AUDIO_CODECS[codec], len(frames))]
+    for seq, capture_time, pcm in frames:
+        payload = np.asarray(pcm, dtype=SAMPLE_TYPES[codec]).tobytes()
+        parts.append(AudioFrameDecoder.FRAME_HEADER.pack(seq, capture_time, len(pcm) // channels, len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from metrics import Metrics
+from inference_executor import PRIORITIES
+
+class BatchScheduler:
+    """
+    Stacks pending decode windows from every session into one batched Whisper call.
+
+    Sessions await `transcribe(samples)`. A single worker task drains the pending list,
+    waiting up to `max_wait` seconds for more windows when the batch is not full, and
+    runs `model.transcribe_batch` on the inference executor. While a batch is on the GPU,
+    new windows accumulate for the next one, so batch size grows with load.
+
+    Windows carry a priority class ("partial" for live caption decodes, "final" for
+    the decode that closes a phrase). Each batch takes the most urgent windows first
+    and is submitted to the executor at the priority of its most urgent window.
+    While the load controller reports overload, batches go to `fallback_model`
+    (a smaller ASR model) if one is loaded.
+    """
+    SAMPLE_RATE = 16000  # Decode windows are 16 kHz mono
+
+    def __init__(self, model, executor, max_batch=8, max_wait=0.02, metrics=None, **options):
+        self.model = model
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.options = options
+        self.metrics = metrics or Metrics()
+        self.fallback_model = None
+        self.load = None  # LoadController, set by the server
+        self.pending = []  # (priority class, samples, prompt, future, queued at)
+        self.wakeup = None
+        self.worker = None
+        self.batches = 0
+        self.windows = 0
+
+    async def transcribe(self, samples, prompt=None, priority="partial"):
+        """Decodes one window; prompt is the text preceding it (Whisper's initial_prompt)."""
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.worker = asyncio.create_task(self.run())
+
+        future = loop.create_future()
+        self.pending.append((priority, samples, prompt, future, time.perf_counter()))
+        self.wakeup.set()
+        return await future
+
+    def average_batch_size(self):
+        return self.windows / self.batches if self.batches else 0.0
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            if len(self.pending) < self.max_batch:
+                await asyncio.sleep(self.max_wait)  # Give other sessions a chance to join the batch
+
+            self.pending.sort(key=lambda item: PRIORITIES[item[0]])  # Stable, so FIFO within a class
+            batch = [item for item in self.pending[:self.max_batch] if not item[3].done()]
+            self.pending = self.pending[self.max_batch:]
+            if self.pending:
+                self.wakeup.set()
+            if not batch:
+                continue
+
+            model = self.model
+            if self.fallback_model is not None and self.load is not None and self.load.use_fallback():
+                model = self.fallback_model
+                self.load.fallback_windows += len(batch)
+
+            self.batches += 1
+            self.windows += len(batch)
+            dispatched = time.perf_counter()
+            for _, _, _, _, queued in batch:
+                self.metrics.observe("asr_queue_wait", dispatched - queued)
+            try:
+                results = await self.executor.submit(model.transcribe_batch, [samples for _, samples, _, _, _ in batch],
+                                                     prompts=[prompt for _, _, prompt, _, _ in batch], priority=batch[0][0],
+                                                     **self.options)
+            except Exception as e:
+                for _, _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            elapsed = time.perf_counter() - dispatched
+            self.metrics.observe("asr_decode", elapsed)
+            audio_seconds = sum(len(samples) for _, samples, _, _, _ in batch) / self.SAMPLE_RATE
+            if audio_seconds:
+                self.metrics.observe("asr_rtf", elapsed / audio_seconds)
+            self.metrics.increment("asr_audio_seconds", audio_seconds)
+
+            for (_, _, _, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
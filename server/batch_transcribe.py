@@ -0,0 +1,262 @@
+"""
+Offline transcription of recorded audio with the server's pipeline.
+
+Transcribes every audio file given (directories are scanned) and writes
+<name>.json next to each file, or into --output, in the same format as the
+live transcription_<time>.json exports:
+
+    python batch_transcribe.py ..\\lectures --output ..\\lectures\\transcripts --workers 4 --batch-size 16
+
+Worker processes read, downmix and resample the files to 16 kHz with the same
+resampler as the live server, and cut them into speech windows with the
+configured VAD, so silence is never decoded. The main process packs windows from several files into each batched decode, then
+adds context (and speakers, when diarization is enabled) per file. Files whose
+output already exists are skipped, so an interrupted backfill can be restarted.
+"""
+import os
+import json
+import time
+import wave
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from vad import VadStage, VAD_BACKENDS
+from resampler import resample
+
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".webm")
+MAX_WINDOW_SECONDS = 30.0  # Whisper's input window
+
+def find_audio_files(inputs):
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                paths.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            paths.append(path)
+    return paths
+
+def load_audio(path):
+    """
+    Returns the file as 16 kHz mono int16. 16-bit WAVs are read directly and resampled with
+    the live server's resampler; other formats are decoded by librosa at their native rate
+    and then go through the same resampler.
+    """
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            if f.getsampwidth() == 2:
+                samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+                return resample(samples, f.getframerate(), SAMPLE_RATE, f.getnchannels())
+    import librosa  # Imported lazily in the worker processes; only needed for compressed formats
+    audio, rate = librosa.load(path, sr=None, mono=True)
+    return resample(audio.astype(np.float32), rate, SAMPLE_RATE)
+
+def split_point(pcm, start, end, search_seconds=5.0):
+    """Quietest 100 ms in the last search_seconds of [start, end), used to split long speech."""
+    frame = SAMPLE_RATE // 100
+    low = max(start, end - int(search_seconds * SAMPLE_RATE))
+    count = (end - low) // frame
+    if count < 10:
+        return end
+    samples = pcm[low:low + count * frame].astype(np.float32)
+    energy = np.square(samples).reshape(count, frame).mean(axis=1)
+    quietest = int(np.argmin(np.convolve(energy, np.ones(10), mode="valid")))
+    return low + (quietest + 5) * frame
+
+def plan_windows(pcm, runs, max_gap):
+    """
+    Merges VAD speech runs into windows of at most MAX_WINDOW_SECONDS. Pauses
+    shorter than max_gap seconds stay inside a window so Whisper hears natural
+    audio; longer silence is dropped. Returns [(start sample, end sample)].
+    """
+    max_samples = int(MAX_WINDOW_SECONDS * SAMPLE_RATE)
+    gap_samples = int(max_gap * SAMPLE_RATE)
+    windows = []
+    for samples, start_time in runs:
+        start = int(round(start_time * SAMPLE_RATE))
+        end = start + len(samples)
+        if windows and start - windows[-1][1] <= gap_samples and end - windows[-1][0] <= max_samples:
+            windows[-1][1] = end
+            continue
+        while end - start > max_samples:  # Continuous speech: split at a quiet point
+            cut = split_point(pcm, start, start + max_samples)
+            windows.append([start, cut])
+            start = cut
+        windows.append([start, end])
+    return [tuple(window) for window in windows]
+
+def prepare(path, vad_backend, max_gap):
+    """Worker: loads one file and returns its duration and [(start seconds, float32 window)]."""
+    pcm = load_audio(path)
+    vad = VadStage(VAD_BACKENDS[vad_backend](), SAMPLE_RATE)
+    windows = [
+        (start / SAMPLE_RATE, pcm[start:end].astype(np.float32) / 32768.0)
+        for start, end in plan_windows(pcm, vad.process(pcm, 0.0), max_gap)
+    ]
+    return path, len(pcm) / SAMPLE_RATE, windows
+
+def output_path(path, output_dir):
+    name = os.path.splitext(os.path.basename(path))[0] + ".json"
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(path)), name)
+
+class BatchTranscriber:
+    """
+    Runs prepared files through batched ASR, context annotation and diarization.
+
+    Windows of all loaded files share one queue, so every decode is a full batch
+    regardless of how the speech is spread over the files. A file is finished
+    (annotated and written) as soon as its last window has been decoded.
+    """
+    def __init__(self, model, audio_processor, batch_size=16, context=True, diarization=False):
+        self.model = model
+        self.audio_processor = audio_processor
+        self.batch_size = batch_size
+        self.context = context
+        self.diarization = diarization
+        self.queue = []  # (file, window index)
+        self.files = []
+        self.decoded_seconds = 0.0
+        self.batches = 0
+
+    def add(self, path, duration, windows, destination):
+        file = {"path": path, "duration": duration, "windows": windows, "results": [None] * len(windows),
+                "left": len(windows), "destination": destination}
+        self.files.append(file)
+        self.queue.extend((file, i) for i in range(len(windows)))
+        if not windows:
+            self.finish(file)
+
+    def decode_ready(self, flush=False):
+        """Decodes full batches (and the remainder when flush is set)."""
+        while len(self.queue) >= self.batch_size or (flush and self.queue):
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            windows = [file["windows"][i][1] for file, i in batch]
+            results = self.model.transcribe_batch(windows)
+            self.batches += 1
+            self.decoded_seconds += sum(len(window) for window in windows) / SAMPLE_RATE
+            for (file, i), result in zip(batch, results):
+                file["results"][i] = result
+                file["left"] -= 1
+                if file["left"] == 0:
+                    self.finish(file)
+
+    def entries(self, file):
+        """Timeline entries for one decoded file, in the TranscriptStore entry layout."""
+        entries = []
+        for (offset, window), result in zip(file["windows"], file["results"]):
+            for segment in result["segments"]:
+                if not segment["text"].strip():
+                    continue
+                entries.append({
+                    "start": offset + segment["start"],
+                    "end": offset + segment["end"],
+                    "text": segment["text"],
+                    "context": "",
+                    "speaker": None,
+                    "clip": window[int(segment["start"] * SAMPLE_RATE):int(segment["end"] * SAMPLE_RATE)]
+                })
+        return entries
+
+    def annotate(self, entries):
+        from context_annotator import ContextAnnotator
+        annotator = self.audio_processor.context_annotator
+        items = [(entry["text"], ContextAnnotator.format_history(entries[:i])) for i, entry in enumerate(entries)]
+        for start in range(0, len(items), annotator.batch_size):
+            contexts = annotator.annotate_batch(items[start:start + annotator.batch_size])
+            for entry, context in zip(entries[start:], contexts):
+                entry["context"] = context or ""
+
+    def diarize(self, entries, min_seconds=0.5, batch_size=8):
+        speakers = self.audio_processor.create_speaker_index()  # Known speakers, or empty per recording
+        long_enough = [entry for entry in entries if len(entry["clip"]) >= min_seconds * SAMPLE_RATE]
+        for start in range(0, len(long_enough), batch_size):
+            batch = long_enough[start:start + batch_size]
+            results = self.audio_processor.diarize_clips([entry["clip"] for entry in batch], speakers)
+            for entry, (speaker_id, _) in zip(batch, results):
+                entry["speaker"] = speaker_id
+        self.audio_processor.save_speaker_index(speakers)
+
+    def finish(self, file):
+        from transcript_store import TranscriptStore
+        entries = self.entries(file)
+        if self.context and entries:
+            self.annotate(entries)
+        if self.diarization and entries:
+            self.diarize(entries)
+        structured = [TranscriptStore.format_entry(entry) for entry in entries]
+        with open(file["destination"], "w") as f:
+            json.dump(structured, f, indent=4)
+        file["windows"] = file["results"] = None  # Free the audio
+        print(f"Saved {len(structured)} segment(s) to {file['destination']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Audio files or directories to transcribe")
+    parser.add_argument("--output", help="Directory for the JSON transcripts (default: next to each file)")
+    parser.add_argument("--config", help="Server config JSON (default: config.json next to this file)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Processes decoding, resampling and segmenting audio")
+    parser.add_argument("--batch-size", type=int, default=16, help="Windows per ASR decode")
+    parser.add_argument("--overwrite", action="store_true", help="Transcribe files that already have an output")
+    args = parser.parse_args()
+
+    # Heavy imports stay out of the worker processes, which re-import this module on Windows
+    from config import load_config, CONFIG_PATH
+    from asr_backends import load_asr_model
+    from audio_processor import AudioProcessor
+
+    config = load_config(args.config or CONFIG_PATH)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    paths = [path for path in find_audio_files(args.inputs) if args.overwrite or not os.path.exists(output_path(path, args.output))]
+    if not paths:
+        print("Nothing to transcribe.")
+        return
+
+    stages = config["stages"]
+    audio_processor = AudioProcessor(vad_backend=config["vad"]["backend"], llm_config=config["llm"],
+                                     cache_dir=config["model_cache_dir"], max_speakers=config["retention"]["max_speakers"],
+                                     speaker_index_path=config["speaker_index_path"])
+    model = load_asr_model(config["asr"], cache_dir=config["model_cache_dir"])
+    if stages["context"]:
+        audio_processor.load_context_annotator()
+    if stages["diarization"]:
+        audio_processor.load_speaker_model()
+    transcriber = BatchTranscriber(model, audio_processor, batch_size=args.batch_size,
+                                   context=stages["context"], diarization=stages["diarization"])
+
+    print(f"Transcribing {len(paths)} file(s) with {args.workers} worker(s)...")
+    started = time.monotonic()
+    audio_seconds = 0.0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Keep a few files per worker in flight so the GPU never waits on audio decoding,
+        # without loading the whole directory into memory
+        pending = []
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append(pool.submit(prepare, path, config["vad"]["backend"], AudioProcessor.PHRASE_TIMEOUT))
+            if len(pending) >= args.workers * 2:
+                break
+        while pending:
+            try:
+                path, duration, windows = pending.pop(0).result()
+            except Exception as e:
+                print(f"Skipping a file that could not be read: {e}")
+                continue
+            finally:
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append(pool.submit(prepare, next_path, config["vad"]["backend"], AudioProcessor.PHRASE_TIMEOUT))
+            audio_seconds += duration
+            transcriber.add(path, duration, windows, output_path(path, args.output))
+            transcriber.decode_ready()
+        transcriber.decode_ready(flush=True)
+
+    wall = time.monotonic() - started
+    print(f"\n{len(transcriber.files)} file(s), {audio_seconds / 3600:.2f} h of audio in {wall:.1f} s "
+          f"({audio_seconds / max(wall, 1e-9):.1f}x real time)")
+    print(f"Decoded {transcriber.decoded_seconds:.1f} s of speech in {transcriber.batches} batch(es); ASR {model.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+
+class CaptionPublisher:
+    """
+    Server -> client caption protocol for one session.
+
+    Remembers what the client has already been sent and turns each new view of a
+    phrase into a compact list of ops:
+
+        {"type": "captions", "ops": [
+            {"op": "add", "id": "3-0", "start": 12.48, "end": 14.02, "text": " Hello", "final": false},
+            {"op": "update", "id": "3-0", "text_from": 6, "text": " there.", "final": true},
+            {"op": "remove", "id": "3-1"}
+        ]}
+
+    `update` only carries the fields that changed; context and speaker arrive as
+    later updates once the background stages have produced them. Text revisions are sent as the
+    common prefix length to keep (`text_from`) plus the replacement suffix, so a
+    revision costs the size of the edit rather than the size of the transcript.
+    """
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.sent = {}  # segment id -> last state sent to the client
+        self.phrase_ids = {}  # phrase index -> segment ids currently shown for it
+        self.messages_sent = 0
+
+    @staticmethod
+    def segment_id(phrase_index, segment_index):
+        return f"{phrase_index}-{segment_index}"
+
+    def build_state(self, segment, final):
+        state = {
+            "start": round(segment["start"], 3),
+            "end": round(segment["end"], 3),
+            "text": segment["text"],
+            "final": final
+        }
+        if segment.get("context"):
+            state["context"] = segment["context"]
+        return state
+
+    def diff_phrase(self, phrase_index, segments, phrase_complete=False):
+        """Returns the ops that bring the client's view of one phrase up to date. Segment times are session times."""
+        ops = []
+        ids = []
+        for i, segment in enumerate(segments):
+            segment_id = self.segment_id(phrase_index, i)
+            ids.append(segment_id)
+            state = self.build_state(segment, phrase_complete or segment.get("committed", False))
+            ops.extend(self.diff_segment(segment_id, state))
+
+        for segment_id in self.phrase_ids.get(phrase_index, []):
+            if segment_id not in ids:
+                ops.append({"op": "remove", "id": segment_id})
+                self.sent.pop(segment_id, None)
+
+        if phrase_complete:
+            for segment_id in ids:  # Final segments never change again
+                self.sent.pop(segment_id, None)
+            self.phrase_ids.pop(phrase_index, None)
+        else:
+            self.phrase_ids[phrase_index] = ids
+        return ops
+
+    def diff_segment(self, segment_id, state):
+        previous = self.sent.get(segment_id)
+        self.sent[segment_id] = state
+        if previous is None:
+            return [{"op": "add", "id": segment_id, **state}]
+        if previous["final"]:
+            self.sent[segment_id] = previous
+            return []
+
+        op = {"op": "update", "id": segment_id}
+        for key, value in state.items():
+            if key == "text" or previous.get(key) == value:
+                continue
+            op[key] = value
+
+        if state["text"] != previous["text"]:
+            keep = 0
+            limit = min(len(previous["text"]), len(state["text"]))
+            while keep < limit and previous["text"][keep] == state["text"][keep]:
+                keep += 1
+            op["text_from"] = keep
+            op["text"] = state["text"][keep:]
+
+        return [op] if len(op) > 2 else []
+
+    def annotation_op(self, segment_id, **fields):
+        """Update op for fields filled in after the text, e.g. context or speaker."""
+        return {"op": "update", "id": segment_id, **fields}
+
+    async def send(self, ops):
+        if not ops:
+            return
+        await self.websocket.send(json.dumps({"type": "captions", "ops": ops}))
+        self.messages_sent += 1
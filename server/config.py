@@ -0,0 +1,77 @@
+import os
+import json
+import copy
+from inference_executor import EXECUTOR_MODES
+
+CONFIG_PATH = os.environ.get(
+    "CAPTION_SERVER_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+)
+
+DEFAULT_CONFIG = {
+    "host": "localhost",
+    "port": 8765,
+    "model_cache_dir": None,  # Where model weights are downloaded; None uses each library's default cache
+    "speaker_index_path": None,  # Known speakers are loaded from this file when diarization starts and saved back when it ends
+    "asr": {
+        "backend": "whisper",  # "whisper", "faster-whisper" or "stub"
+        "model": "turbo",
+        "device": "auto",  # "auto", "cuda" or "cpu"
+        "compute_type": "auto",  # "auto", "float16", "float32", "int8", "int8_float16"
+        "min_new_audio_ms": 300,  # Voiced audio that must arrive before the window is decoded again
+        "fallback_model": None  # Smaller model (e.g. "base") used while the server is overloaded
+    },
+    "llm": {
+        "backend": "local",  # "local" (transformers) or "stub"
+        "model": "TheBloke/Mistral-7B-Instruct-v0.1-GPTQ"
+    },
+    "vad": {
+        "backend": "webrtc"  # "webrtc" or "energy"
+    },
+    "executor": {
+        "mode": "thread",  # Only "thread": model calls are bound methods of models loaded in the server process
+        "max_workers": 1,
+        "max_queue": 8
+    },
+    "stages": {
+        "context": True,  # Load the LLM and annotate captions with context
+        "live_context": True,  # Annotate finalized segments while the session runs (needs "context")
+        "diarization": True  # Load the speaker model and assign speakers
+    },
+    "scheduling": {
+        "latency_slo": 1.5,  # Target seconds from queuing an ASR window to its result
+        "max_sessions": 16  # New connections are refused beyond this (and while overloaded)
+    },
+    "retention": {
+        "audio_seconds": 60,  # Voiced audio kept per session for the decode window and speaker clips
+        "transcript_seconds": 300,  # Finalized segments older than this live only in the session log
+        "max_speakers": 32  # Least recently heard speakers are forgotten beyond this
+    },
+    "metrics": {
+        "enabled": False,
+        "log_interval": 30  # Seconds between structured metrics log lines, 0 to disable
+    }
+}
+
+def merge(base, override):
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+def validate(config):
+    """Raises ValueError for settings the server cannot run with."""
+    if config["executor"]["mode"] not in EXECUTOR_MODES:
+        raise ValueError(f"executor.mode must be one of {', '.join(EXECUTOR_MODES)}, got {config['executor']['mode']!r}")
+    return config
+
+def load_config(path=CONFIG_PATH):
+    """Returns the defaults overridden by the JSON file at path, if it exists."""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            merge(config, json.load(f))
+        print(f"Loaded config from {path}")
+    return validate(config)
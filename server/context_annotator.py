@@ -0,0 +1,101 @@
+import os
+import hashlib
+from string import Formatter
+from collections import OrderedDict
+
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_prompt.txt")
+
+class ContextAnnotator:
+    """
+    Adds LLM context tags to captions in batches.
+
+    The prompt template is read once, many captions are generated per
+    `generate_batch` call, and results are cached by (caption, history) so a
+    repeated line is never generated twice.
+    """
+    def __init__(self, llm, prompt_path=PROMPT_PATH, batch_size=8, cache_size=2048):
+        self.llm = llm
+        self.prompt_path = prompt_path
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_mtime = None
+        self.prompt_template = None
+        self.load_template()
+
+    def load_template(self):
+        """(Re)reads the prompt template and hands its static prefix to the LLM's KV cache."""
+        try:
+            self.template_mtime = os.path.getmtime(self.prompt_path)
+            with open(self.prompt_path, "r") as file:
+                self.prompt_template = file.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"The prompt file '{self.prompt_path}' was not found.")
+
+        # Everything before the first {field} is identical for every caption
+        literal_prefix = next(Formatter().parse(self.prompt_template), ("",))[0]
+        self.llm.set_prompt_prefix(literal_prefix)
+        self.cache.clear()  # Cached contexts were generated from the old template
+
+    def refresh_template(self):
+        if os.path.getmtime(self.prompt_path) != self.template_mtime:
+            print(f"Prompt template {self.prompt_path} changed, reloading.")
+            self.load_template()
+
+    @staticmethod
+    def format_history(transcription_history):
+        """Builds the history string from the segments preceding a caption."""
+        history = ''
+        if transcription_history:
+            recent_history = transcription_history[-4:-1]
+            history = ', '.join(obj['text'] for obj in recent_history)
+        return f"[{history}]"
+
+    @staticmethod
+    def cache_key(caption, history):
+        return hashlib.sha1(f"{caption}\x00{history}".encode("utf-8")).hexdigest()
+
+    def build_prompt(self, caption, history):
+        return self.prompt_template.format(caption=caption, history=history)  # format with caption inserted at end of prompt
+
+    def annotate(self, caption, history):
+        return self.annotate_batch([(caption, history)])[0]
+
+    def annotate_batch(self, items):
+        """Returns a context for each (caption, history) pair, generating only cache misses."""
+        self.refresh_template()
+        results = [None] * len(items)
+        pending = OrderedDict()  # cache key -> indices waiting on it
+
+        for i, (caption, history) in enumerate(items):
+            key = self.cache_key(caption, history)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                results[i] = self.cache[key]
+                self.cache_hits += 1
+            else:
+                pending.setdefault(key, []).append(i)
+
+        keys = list(pending)
+        self.cache_misses += len(keys)
+        for start in range(0, len(keys), self.batch_size):
+            batch_keys = keys[start:start + self.batch_size]
+            prompts = [self.build_prompt(*items[pending[key][0]]) for key in batch_keys]
+            try:
+                responses = self.llm.generate_batch(prompts)
+            except Exception as e:
+                print(f"exeption: {e}")
+                continue
+
+            for key, response in zip(batch_keys, responses):
+                self.store(key, response)
+                for i in pending[key]:
+                    results[i] = response
+        return results
+
+    def store(self, key, response):
+        self.cache[key] = response
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
@@ -0,0 +1,91 @@
+import asyncio
+import numpy as np
+from metrics import Metrics
+
+class DiarizationStage:
+    """
+    Background speaker assignment for finalized segments of one session.
+
+    Segments are queued with their sample range in the session's ring buffer.
+    The worker waits briefly so several segments can share one batched
+    `encode_batch` call on the inference executor, then reports each speaker
+    through `on_speaker`. Captions are never held back waiting for it. The
+    speaker index starts with the known speakers and is saved back on stop.
+    """
+    def __init__(self, audio_processor, audio, executor, on_speaker, batch_size=8, max_wait=0.5, min_seconds=0.5, metrics=None):
+        self.audio_processor = audio_processor
+        self.audio = audio
+        self.executor = executor
+        self.on_speaker = on_speaker  # async callback(segment_id, speaker_id)
+        self.speakers = audio_processor.create_speaker_index()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.metrics = metrics or Metrics()
+        self.min_samples = int(min_seconds * audio.sample_rate)
+        self.pending = []  # (segment id, start index, end index)
+        self.wakeup = asyncio.Event()
+        self.worker = None
+        self.assigned = 0
+        self.skipped = 0
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+            # Through the executor, so it runs after a diarization call the cancel left running
+            await self.executor.submit(self.audio_processor.save_speaker_index, self.speakers, priority="diarization")
+
+    def submit(self, segment_id, start_index, end_index):
+        if end_index - start_index < self.min_samples:
+            self.skipped += 1  # Too short for a reliable embedding
+            return
+        self.pending.append((segment_id, start_index, end_index))
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if len(self.pending) < self.batch_size:
+                await asyncio.sleep(self.max_wait)  # Let more segments finalize to share the batch
+
+            while self.pending:
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+                ids = []
+                clips = []
+                for segment_id, start_index, end_index in batch:
+                    if start_index < self.audio.oldest_index:
+                        self.skipped += 1  # Already overwritten in the ring buffer
+                        continue
+                    ids.append(segment_id)
+                    clips.append(np.array(self.audio.view(start_index, end_index)))  # Copy before the ring wraps
+                if not clips:
+                    continue
+
+                try:
+                    with self.metrics.time("diarization"):
+                        results = await self.executor.submit(self.audio_processor.diarize_clips, clips, self.speakers,
+                                                             priority="diarization")
+                except Exception as e:
+                    print(f"Diarization failed: {e}")
+                    continue
+
+                for segment_id, (speaker_id, _) in zip(ids, results):
+                    self.assigned += 1
+                    await self.on_speaker(segment_id, speaker_id)
+
+    def stats(self):
+        return {
+            "queued": len(self.pending),
+            "assigned": self.assigned,
+            "skipped": self.skipped,
+            "speakers": len(self.speakers)
+        }
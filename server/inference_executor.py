@@ -0,0 +1,118 @@
+import heapq
+import asyncio
+import itertools
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Metrics
+
+# Priority classes, most urgent first: live caption decodes, decodes that finalize a
+# phrase, LLM context annotation, speaker embeddings
+PRIORITIES = {"partial": 0, "final": 1, "context": 2, "diarization": 3}
+EXECUTOR_MODES = ("thread",)
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls (Whisper, speaker embeddings, LLM) off the asyncio event loop.
+
+    Calls run on a thread pool, a single worker by default so every model call is
+    serialized on the GPU without holding up the websocket receive path. "thread" is
+    the only mode: callers submit bound methods of models loaded in this process
+    (and update their counters and caches), which a process pool could not run.
+
+    At most `max_workers` calls run at once; the rest wait in the executor, not in the
+    pool's FIFO, and are started strictly by priority class (see PRIORITIES) and then
+    in submission order. So a live caption decode submitted behind a batch of LLM
+    annotations starts as soon as the current call finishes. Waiting callers are the
+    backpressure; `is_full()` (more than `max_queue` calls pending) tells the load
+    controller the device is saturated.
+    """
+    def __init__(self, mode="thread", max_workers=1, max_queue=8, initializer=None, initargs=(), metrics=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unsupported executor mode: {mode} (supported: {', '.join(EXECUTOR_MODES)})")
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference",
+                                       initializer=initializer, initargs=initargs)
+
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.metrics = metrics or Metrics()
+        self.waiters = []  # (priority, seq, future) heap of callers waiting for a worker
+        self.seq = itertools.count()
+        self.running = 0
+        self.waiting = 0
+        self.waiting_by_priority = dict.fromkeys(PRIORITIES, 0)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+
+    def queue_depth(self):
+        """Number of calls either executing or waiting for a slot."""
+        return self.running + self.waiting
+
+    def is_full(self):
+        return self.queue_depth() >= self.max_queue
+
+    async def submit(self, fn, *args, priority="context", **kwargs):
+        """Runs fn(*args, **kwargs) on the pool once a worker is free for its priority class; returns the result."""
+        self.submitted += 1
+        with self.metrics.time("executor_wait"):
+            await self.acquire(priority)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.release()
+        self.completed += 1
+        return result
+
+    async def acquire(self, priority):
+        if self.running < self.max_workers and not self.waiters:
+            self.running += 1
+            return
+
+        if self.is_full():
+            self.backpressure_waits += 1
+            print(f"Inference queue full ({self.queue_depth()} pending), waiting for a free worker.")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (PRIORITIES[priority], next(self.seq), future))
+        self.waiting += 1
+        self.waiting_by_priority[priority] += 1
+        self.max_depth = max(self.max_depth, self.queue_depth())
+        try:
+            await future  # Resolved by release(), which hands over its worker
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # The worker was already handed to us; pass it on
+            raise
+        finally:
+            self.waiting -= 1
+            self.waiting_by_priority[priority] -= 1
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():  # Skip callers cancelled while waiting
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "max_depth": self.max_depth,
+            "waiting": dict(self.waiting_by_priority),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "backpressure_waits": self.backpressure_waits
+        }
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
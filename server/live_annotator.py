@@ -0,0 +1,125 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from metrics import Metrics
+
+class LiveAnnotator:
+    """
+    Background LLM context annotation for finalized segments of one session.
+
+    Segments are queued by deadline (finalization time + `target_latency`) in a
+    bounded priority queue. The worker takes the most urgent ones, coalescing
+    whatever has piled up into a single batched generate call, and drops
+    segments that are already more than `max_lag` seconds old instead of
+    annotating stale captions. Anything dropped is picked up again by the
+    end-of-session pass.
+    """
+    def __init__(self, annotator, executor, on_context, session_clock, target_latency=2.0, max_lag=10.0, max_queue=32, batch_size=4, metrics=None):
+        self.annotator = annotator
+        self.executor = executor
+        self.on_context = on_context  # async callback(segment_id, context)
+        self.session_clock = session_clock  # Returns the current session time in seconds
+        self.target_latency = target_latency
+        self.max_lag = max_lag
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics()
+        self.queue = []  # (deadline, seq, item)
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.worker = None
+        self.annotated = 0
+        self.dropped = 0
+        self.lags = deque(maxlen=1000)  # Finalization -> context available (seconds)
+        self.caption_lags = deque(maxlen=1000)  # Caption end time -> context available (session seconds)
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def submit(self, segment_id, caption, history, caption_end):
+        """Queues a finalized segment. caption_end is its end time in session seconds."""
+        now = time.monotonic()
+        item = {
+            "id": segment_id,
+            "caption": caption,
+            "history": history,
+            "caption_end": caption_end,
+            "finalized_at": now
+        }
+        heapq.heappush(self.queue, (now + self.target_latency, next(self.seq), item))
+        if len(self.queue) > self.max_queue:
+            # Shed the most overdue segment so fresh captions stay on time;
+            # the end-of-session pass will still annotate it
+            heapq.heappop(self.queue)
+            self.dropped += 1
+        self.wakeup.set()
+
+    def take_batch(self):
+        now = time.monotonic()
+        batch = []
+        while self.queue and len(batch) < self.batch_size:
+            _, _, item = heapq.heappop(self.queue)
+            if now - item["finalized_at"] > self.max_lag:
+                self.dropped += 1
+                continue
+            batch.append(item)
+        return batch
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while self.queue:
+                batch = self.take_batch()
+                if not batch:
+                    continue
+                try:
+                    with self.metrics.time("llm_annotation"):
+                        contexts = await self.executor.submit(
+                            self.annotator.annotate_batch,
+                            [(item["caption"], item["history"]) for item in batch],
+                            priority="context"
+                        )
+                except Exception as e:
+                    print(f"Live annotation failed: {e}")
+                    continue
+                now = time.monotonic()
+                for item, context in zip(batch, contexts):
+                    if context is None:
+                        continue
+                    self.annotated += 1
+                    lag = now - item["finalized_at"]
+                    self.lags.append(lag)
+                    self.caption_lags.append(self.session_clock() - item["caption_end"])
+                    await self.on_context(item["id"], context)
+
+    @staticmethod
+    def percentile(values, q):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        return {
+            "queued": len(self.queue),
+            "annotated": self.annotated,
+            "dropped": self.dropped,
+            "lag_p50": self.percentile(self.lags, 0.5),
+            "lag_p95": self.percentile(self.lags, 0.95),
+            "caption_lag_p50": self.percentile(self.caption_lags, 0.5),
+            "caption_lag_p95": self.percentile(self.caption_lags, 0.95)
+        }
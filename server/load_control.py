@@ -0,0 +1,92 @@
+import time
+
+LEVELS = ("normal", "degraded", "overloaded")
+
+class LoadController:
+    """
+    Decides how much work the server takes on from the ASR latency it delivers.
+
+    Sessions report how long each decode window took from queuing to result; the
+    controller keeps an exponential moving average and compares it with the
+    latency SLO:
+
+        normal      everything runs
+        degraded    average above the SLO (or the inference queue is full):
+                    live context annotation and diarization are shed, so the GPU
+                    goes to captions; skipped segments are annotated at session end
+        overloaded  average above twice the SLO: additionally the transcription
+                    tick is lengthened, the fallback ASR model is used if one is
+                    configured, and new connections are refused
+
+    A level is left only once the average falls below `recovery` times its
+    threshold, so the server does not flap. Without decodes for `idle_seconds`
+    the average is considered stale and the level drops back to normal.
+    """
+    def __init__(self, latency_slo=1.5, max_sessions=16, tick_seconds=0.1, overloaded_tick_seconds=0.3,
+                 smoothing=0.2, recovery=0.7, idle_seconds=5.0):
+        self.latency_slo = latency_slo
+        self.max_sessions = max_sessions
+        self.tick_seconds = tick_seconds
+        self.overloaded_tick_seconds = overloaded_tick_seconds
+        self.smoothing = smoothing
+        self.recovery = recovery
+        self.idle_seconds = idle_seconds
+        self.executor = None  # Set by the server; a full inference queue counts as degraded
+        self.latency = None  # Moving average of ASR window latency (seconds)
+        self.last_observed = 0.0
+        self.current = 0
+        self.shed = {"context": 0, "diarization": 0}
+        self.rejected = 0
+        self.fallback_windows = 0
+
+    def observe(self, latency):
+        """Records the queue + decode time of one ASR window."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        self.last_observed = time.monotonic()
+
+    def level(self):
+        if self.latency is None or time.monotonic() - self.last_observed > self.idle_seconds:
+            self.current = 0
+            return self.current
+        thresholds = (self.latency_slo, self.latency_slo * 2)
+        level = sum(self.latency > threshold for threshold in thresholds)
+        if level < self.current and self.latency > thresholds[self.current - 1] * self.recovery:
+            level = self.current  # Not recovered far enough yet
+        if self.executor is not None and self.executor.is_full():
+            level = max(level, 1)
+        self.current = level
+        return self.current
+
+    def allow(self, stage):
+        """False while background work of this stage ("context" or "diarization") is being shed; counts it."""
+        if self.level() >= 1:
+            self.shed[stage] += 1
+            return False
+        return True
+
+    def admit(self, sessions):
+        """Whether a new connection may start a session."""
+        if sessions >= self.max_sessions or self.level() >= 2:
+            self.rejected += 1
+            return False
+        return True
+
+    def tick(self):
+        """Seconds between transcription ticks of a session."""
+        return self.overloaded_tick_seconds if self.level() >= 2 else self.tick_seconds
+
+    def use_fallback(self):
+        return self.level() >= 2
+
+    def stats(self):
+        return {
+            "level": LEVELS[self.level()],
+            "asr_latency": self.latency,
+            "latency_slo": self.latency_slo,
+            "shed": dict(self.shed),
+            "rejected_connections": self.rejected,
+            "fallback_windows": self.fallback_windows
+        }
@@ -1,12 +1,17 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
+import time
+import copy
 
 class Manager_LLM:
-    def __init__(self, model_name="TheBloke/Mistral-7B-Instruct-v0.1-GPTQ"):
+    PREFIX_SENTINEL = "\u241e"  # Never appears in captions; marks where the static prefix ends
+
+    def __init__(self, model_name="TheBloke/Mistral-7B-Instruct-v0.1-GPTQ", cache_dir=None):
+        from transformers import AutoModelForCausalLM, AutoTokenizer  # Imported lazily so the stub backend works without transformers
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, cache_dir=cache_dir)
         self.model = AutoModelForCausalLM.from_pretrained(
             model_name,
+            cache_dir=cache_dir,
             device_map=self.device,
             use_safetensors=True,
             revision="main",
@@ -14,32 +19,128 @@ class Manager_LLM:
         )
         self.chat_template = "[INST] {prompt} [/INST]"
 
-    def generate_response(self, prompt: str, max_tokens: int = 48,
-                 temperature: float = 0.7, top_p: float = 0.95) -> str:
+        # Batched generation needs left padding so every prompt ends where generation starts
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.prompt_prefix = None
+        self.formatted_prefix = None
+        self.prefix_cache = None
+
+    def format_prompt(self, prompt: str) -> str:
         # Format prompt using the chat template
-        formatted_prompt = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             [{"role": "user", "content": prompt}],
             tokenize=False,
             add_generation_prompt=True
         )
-        # Tokenize the prompt and move to the device where the model is loaded
-        inputs = self.tokenizer(formatted_prompt, return_tensors="pt").to(self.model.device)
+
+    def set_prompt_prefix(self, prefix: str):
+        """
+        Declares the static text every prompt starts with (e.g. the instructions in
+        llm_prompt.txt). Its past-key-values are computed on first use and reused, so
+        each call only prefills the per-caption suffix. Changing the prefix drops the cache.
+        """
+        if prefix == self.prompt_prefix:
+            return
+        self.prompt_prefix = prefix
+        self.prefix_cache = None
+        # The chat template wraps the prompt, so cache the formatted text up to where the prefix ends
+        self.formatted_prefix = self.format_prompt(prefix + self.PREFIX_SENTINEL).split(self.PREFIX_SENTINEL)[0] if prefix else None
+
+    def get_prefix_cache(self, formatted_prompts):
+        if not self.formatted_prefix:
+            return None
+        if not all(prompt.startswith(self.formatted_prefix) for prompt in formatted_prompts):
+            return None
+
+        if self.prefix_cache is None:
+            prefix_ids = self.tokenizer(self.formatted_prefix, return_tensors="pt").input_ids.to(self.model.device)
+            with torch.inference_mode():
+                outputs = self.model(input_ids=prefix_ids, use_cache=True)
+            self.prefix_cache = {"ids": prefix_ids, "past_key_values": outputs.past_key_values}
+        return self.prefix_cache
+
+    def generate_response(self, prompt: str, max_tokens: int = 48,
+                 temperature: float = 0.7, top_p: float = 0.95) -> str:
+        return self.generate_batch([prompt], max_tokens, temperature, top_p)[0]
+
+    def generate_batch(self, prompts: list[str], max_tokens: int = 48,
+                 temperature: float = 0.7, top_p: float = 0.95) -> list[str]:
+        """Generates responses for several prompts with a single padded model.generate call."""
+        formatted_prompts = [self.format_prompt(prompt) for prompt in prompts]
+        prefix_cache = self.get_prefix_cache(formatted_prompts)
+
+        if prefix_cache is not None:
+            # Tokenize the whole prompts: a suffix tokenized on its own starts a new word ("▁[" instead
+            # of "["), so the cache is only used when every prompt starts with exactly the cached ids
+            prefix_ids = prefix_cache["ids"][0].tolist()
+            prefix_length = len(prefix_ids)
+            rows = self.tokenizer(formatted_prompts).input_ids
+            if not all(row[:prefix_length] == prefix_ids for row in rows):
+                prefix_cache = None
+
+        if prefix_cache is None:
+            # Tokenize the prompts and move to the device where the model is loaded
+            inputs = self.tokenizer(formatted_prompts, return_tensors="pt", padding=True).to(self.model.device)
+            input_ids, attention_mask, past_key_values = inputs.input_ids, inputs.attention_mask, None
+        else:
+            # Padding sits between the cached prefix and each suffix and is masked out,
+            # so every row still ends where generation starts.
+            suffix_inputs = self.tokenizer.pad({"input_ids": [row[prefix_length:] for row in rows]},
+                                               return_tensors="pt").to(self.model.device)
+            prefix_ids = prefix_cache["ids"].expand(len(prompts), -1)
+            input_ids = torch.cat([prefix_ids, suffix_inputs.input_ids], dim=1)
+            attention_mask = torch.cat([torch.ones_like(prefix_ids), suffix_inputs.attention_mask], dim=1)
+            past_key_values = copy.deepcopy(prefix_cache["past_key_values"])  # generate() extends it in place
+            past_key_values.batch_repeat_interleave(len(prompts))
 
         # Generate response in inference mode (no gradient tracking)
         with torch.inference_mode():
             outputs = self.model.generate(
-                **inputs,
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
                 max_new_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
                 do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=self.tokenizer.pad_token_id
             )
         # Decode the new tokens (excluding the input prompt)
-        return self.tokenizer.decode(
-            outputs[0][inputs.input_ids.shape[1]:],
-            skip_special_tokens=True
-        )
+        return self.tokenizer.batch_decode(outputs[:, input_ids.shape[1]:], skip_special_tokens=True)
+
+class StubLLM:
+    """
+    Deterministic stand-in for Manager_LLM so the annotation pipeline can run and be
+    benchmarked on CPU. `latency` simulates per-call and per-prompt generation time.
+    """
+    def __init__(self, response="[]", latency=0.0, per_prompt_latency=0.0):
+        self.response = response
+        self.latency = latency
+        self.per_prompt_latency = per_prompt_latency
+        self.calls = 0
+
+    def set_prompt_prefix(self, prefix: str):
+        pass
+
+    def generate_response(self, prompt: str, **kwargs) -> str:
+        return self.generate_batch([prompt], **kwargs)[0]
+
+    def generate_batch(self, prompts: list[str], **kwargs) -> list[str]:
+        self.calls += 1
+        time.sleep(self.latency + self.per_prompt_latency * len(prompts))
+        return [self.response for _ in prompts]
+
+def load_llm(llm_config, cache_dir=None):
+    """Builds the context LLM described by the "llm" section of the server config."""
+    backend = llm_config.get("backend", "local")
+    if backend == "stub":
+        return StubLLM(latency=llm_config.get("latency", 0.0), per_prompt_latency=llm_config.get("per_prompt_latency", 0.0))
+    if backend == "local":
+        return Manager_LLM(llm_config.get("model", "TheBloke/Mistral-7B-Instruct-v0.1-GPTQ"), cache_dir=cache_dir)
+    raise ValueError(f"Unknown LLM backend: {backend}")
 
 if __name__ == "__main__":
     print("Checking CUDA availability...")
@@ -0,0 +1,135 @@
+import json
+import time
+import bisect
+import asyncio
+
+# Bucket upper bounds from 1 ms to ~66 s, four per octave
+BUCKETS = [0.001 * 2 ** (i / 4) for i in range(65)]
+
+class Histogram:
+    """Fixed-bucket histogram; memory and observe() cost stay constant however long the server runs."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+class Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Metrics:
+    """
+    Per-stage latency histograms for the caption pipeline.
+
+    Stages time themselves with `with metrics.time("asr_decode"): ...` or report a
+    value with `metrics.observe(name, seconds)`. When disabled both return
+    immediately (a shared no-op context manager, no clock reads), so the
+    instrumentation can stay in the hot path.
+
+    Stage names:
+        resample            converting one audio message from the client's rate/channels to 16 kHz mono
+        vad                 receive -> VAD -> ring buffer write of one audio message
+        preprocess          slicing the decode window out of the ring buffer
+        asr_queue_wait      window queued in the batch scheduler until its batch is dispatched
+        executor_wait       waiting for a free inference slot (backpressure)
+        asr_decode          one batched decode on the executor
+        asr_rtf             decode time / audio seconds in the batch (real-time factor)
+        decoder             LocalAgreement update of the streaming decoder
+        segments            transcript update and caption diffing
+        send                writing one caption message to the websocket
+        caption_latency     newest decoded audio captured -> caption sent
+        llm_annotation      one batched context annotation call
+        diarization         one batched speaker embedding + matching call
+
+    Counters:
+        asr_audio_seconds       audio seconds sent to the ASR model
+        asr_skipped_decodes     ticks that did not decode because too little new speech arrived
+        asr_cached_decodes      decodes answered from the previous, identical window
+        transcription_errors    transcription ticks that raised (the loop carries on)
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.monotonic()
+
+    def time(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        return {
+            "uptime": time.monotonic() - self.started,
+            "stages": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            "counters": dict(self.counters)
+        }
+
+    async def report_loop(self, interval, extra=None):
+        """Prints one JSON line with the snapshot (plus extra(), e.g. queue depths) every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            record = {"type": "metrics", **self.snapshot()}
+            if extra:
+                record["queues"] = extra()
+            print(json.dumps(record, default=str))
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class ModelRegistry:
+    """
+    Loads the server's models in the background and tracks readiness per capability.
+
+    Each capability ("asr", "speaker", "context") has a loader that runs on its own
+    thread, so Whisper, the speaker model and the LLM load concurrently while the
+    websocket is already accepting connections. Callers check `ready(name)` and
+    skip (or defer) work whose model is not loaded yet; disabled capabilities are
+    never loaded.
+    """
+    def __init__(self):
+        self.loaders = {}
+        self.models = {}
+        self.status = {}  # name -> "disabled" | "pending" | "loading" | "ready" | "failed"
+        self.errors = {}
+        self.load_seconds = {}
+        self.events = {}
+        self.tasks = []
+        self.pool = None
+
+    def register(self, name, loader, enabled=True):
+        self.loaders[name] = loader
+        self.status[name] = "pending" if enabled else "disabled"
+        self.events[name] = asyncio.Event()
+        if not enabled:
+            self.events[name].set()
+
+    def start(self):
+        """Starts loading every enabled capability; returns immediately."""
+        pending = [name for name, status in self.status.items() if status == "pending"]
+        if not pending:
+            return
+        self.pool = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="model-loader")
+        for name in pending:
+            self.status[name] = "loading"
+            self.tasks.append(asyncio.create_task(self.load(name)))
+
+    async def load(self, name):
+        start = time.monotonic()
+        try:
+            self.models[name] = await asyncio.get_running_loop().run_in_executor(self.pool, self.loaders[name])
+            self.status[name] = "ready"
+            print(f"Model '{name}' ready after {time.monotonic() - start:.1f} s.")
+        except Exception as e:
+            self.status[name] = "failed"
+            self.errors[name] = str(e)
+            print(f"Model '{name}' failed to load: {e}")
+        finally:
+            self.load_seconds[name] = time.monotonic() - start
+            self.events[name].set()
+
+    def enabled(self, name):
+        return self.status.get(name, "disabled") != "disabled"
+
+    def ready(self, name):
+        return self.status.get(name) == "ready"
+
+    def get(self, name):
+        return self.models.get(name)
+
+    async def wait(self, name):
+        """Waits until the capability has finished loading (or failed) and returns its model."""
+        await self.events[name].wait()
+        return self.models.get(name)
+
+    async def wait_all(self):
+        for name in self.events:
+            await self.wait(name)
+
+    def readiness(self):
+        readiness = {}
+        for name, status in self.status.items():
+            readiness[name] = {"status": status}
+            if name in self.load_seconds:
+                readiness[name]["load_seconds"] = round(self.load_seconds[name], 2)
+            if name in self.errors:
+                readiness[name]["error"] = self.errors[name]
+        return readiness
@@ -0,0 +1,118 @@
+from math import gcd
+import numpy as np
+
+class StreamingResampler:
+    """
+    Polyphase resampler from a client's native rate and channel layout to 16 kHz mono int16.
+
+    The ratio is reduced to up/down = L/M, and a Kaiser-windowed sinc low-pass
+    (cutoff just below the lower Nyquist frequency, so decimation does not alias)
+    is split into L phases of K taps. Output sample n then needs K multiply-adds
+    with phase (n*M + D) % L, computed for a whole chunk with one gather and one
+    einsum. The last K input samples are kept between calls, so chunks of any
+    size give the same output as resampling the whole stream at once, with no
+    clicks at chunk boundaries. D centres the filter, so output time lines up
+    with input time; the newest few input samples are held back until enough
+    later input arrives (`flush` releases them at the end of a stream).
+
+    Interleaved int16 or float32 input is downmixed by averaging the channels.
+    At the target rate only the downmix/conversion is done.
+    """
+    BLOCK = 8192  # Output samples per vectorized step, bounds the gathered matrix
+
+    def __init__(self, in_rate, out_rate=16000, channels=1, half_taps=16, rolloff=0.9, beta=8.0):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.passthrough = in_rate == out_rate
+        self.input_samples = 0
+        self.output_samples = 0
+        if self.passthrough:
+            return
+
+        # Prototype low-pass at the upsampled rate, gain `up` to make up for the inserted zeros
+        half = half_taps * max(self.up, self.down)
+        cutoff = rolloff / max(self.up, self.down)
+        n = np.arange(-half, half + 1)
+        prototype = cutoff * np.sinc(cutoff * n) * np.kaiser(2 * half + 1, beta) * self.up
+        self.taps = -(-len(prototype) // self.up)  # K taps per phase
+        padded = np.zeros(self.taps * self.up)
+        padded[:len(prototype)] = prototype
+        self.phases = padded.reshape(self.taps, self.up).T.astype(np.float32)  # phases[p, k] = prototype[p + k*up]
+        self.delay = half  # Group delay at the upsampled rate
+
+        self.buffer = np.zeros(self.taps, dtype=np.float32)  # Input history, starting at absolute index buffer_start
+        self.buffer_start = -self.taps
+
+    def lag_seconds(self):
+        """Input duration received but not yet output; subtract from a chunk's start time to time its output."""
+        return self.input_samples / self.in_rate - self.output_samples / self.out_rate
+
+    def mono(self, samples):
+        """Float32 mono in [-1, 1) from interleaved int16 or float32 samples."""
+        samples = np.asarray(samples)
+        scale = 1 / 32768.0 if samples.dtype == np.int16 else 1.0
+        if self.channels > 1:
+            samples = samples[:len(samples) - len(samples) % self.channels].reshape(-1, self.channels).mean(axis=1)
+        return samples.astype(np.float32) * scale
+
+    @staticmethod
+    def to_int16(samples):
+        return (np.clip(samples, -1.0, 32767 / 32768.0) * 32768.0).astype(np.int16)
+
+    def process(self, samples):
+        """Resamples the next chunk of the stream; returns int16 mono samples at out_rate."""
+        samples = np.asarray(samples)
+        if self.passthrough:
+            self.input_samples += len(samples) // self.channels
+            if samples.dtype == np.int16 and self.channels == 1:
+                self.output_samples += len(samples)
+                return samples
+            out = self.to_int16(self.mono(samples))
+            self.output_samples += len(out)
+            return out
+
+        mono = self.mono(samples)
+        self.buffer = np.concatenate([self.buffer, mono])
+        self.input_samples += len(mono)
+        # Output n can be computed once input (n*M + D) // L has arrived
+        available = max(0, -(-(self.input_samples * self.up - self.delay) // self.down))
+        return self.produce(available)
+
+    def flush(self):
+        """Releases the samples held back at the end of the stream (the input is padded with silence)."""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.int16)
+        expected = -(-self.input_samples * self.up // self.down)
+        self.buffer = np.concatenate([self.buffer, np.zeros(self.taps, dtype=np.float32)])
+        return self.produce(expected)
+
+    def produce(self, end):
+        blocks = []
+        offsets = np.arange(self.taps)
+        while self.output_samples < end:
+            n = np.arange(self.output_samples, min(end, self.output_samples + self.BLOCK))
+            position = n * self.down + self.delay
+            phase = position % self.up
+            newest = position // self.up - self.buffer_start  # Buffer index of each output's newest input
+            window = self.buffer[newest[:, None] - offsets]  # (outputs, taps), newest input first
+            blocks.append(np.einsum("nk,nk->n", window, self.phases[phase]))
+            self.output_samples = int(n[-1]) + 1
+
+        # Drop history the next output no longer needs
+        oldest = (self.output_samples * self.down + self.delay) // self.up - self.taps + 1
+        if oldest > self.buffer_start:
+            self.buffer = self.buffer[oldest - self.buffer_start:]
+            self.buffer_start = oldest
+
+        if not blocks:
+            return np.zeros(0, dtype=np.int16)
+        return self.to_int16(np.concatenate(blocks))
+
+def resample(samples, in_rate, out_rate=16000, channels=1):
+    """Resamples a complete recording; returns int16 mono at out_rate."""
+    resampler = StreamingResampler(in_rate, out_rate, channels)
+    return np.concatenate([resampler.process(samples), resampler.flush()])
@@ -0,0 +1,101 @@
+from bisect import bisect_right
+import numpy as np
+
+class AudioRingBuffer:
+    """
+    Preallocated float32 ring buffer of accepted audio for one session.
+
+    Samples are addressed by absolute index (total samples written so far), and
+    each written chunk records the session time of its first sample, so ranges
+    can be looked up by index or by time. Every sample is written twice, at
+    `pos` and `pos + capacity`, so any range of up to `capacity` samples is one
+    contiguous slice and `view` never copies.
+    """
+    def __init__(self, capacity_seconds=60, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.capacity = int(capacity_seconds * sample_rate)
+        self.data = np.zeros(self.capacity * 2, dtype=np.float32)
+        self.write_index = 0
+        self.chunk_index = []  # Absolute index of the first sample of each chunk
+        self.chunk_time = []  # Session time (seconds) of the first sample of each chunk
+
+    @property
+    def oldest_index(self):
+        return max(0, self.write_index - self.capacity)
+
+    def write(self, samples, timestamp, scale=1.0):
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            timestamp += (n - self.capacity) / self.sample_rate
+            n = self.capacity
+
+        self.chunk_index.append(self.write_index)
+        self.chunk_time.append(timestamp)
+
+        pos = self.write_index % self.capacity
+        first = min(n, self.capacity - pos)
+        for offset in (0, self.capacity):  # Primary copy and mirror
+            np.multiply(samples[:first], scale, out=self.data[offset + pos:offset + pos + first], casting="unsafe")
+            if first < n:
+                np.multiply(samples[first:], scale, out=self.data[offset:offset + n - first], casting="unsafe")
+        self.write_index += n
+
+        # Forget chunk timestamps for audio that has been overwritten
+        if len(self.chunk_index) > 4096 and self.chunk_index[1024] < self.oldest_index:
+            del self.chunk_index[:1024]
+            del self.chunk_time[:1024]
+
+    def pauses(self, start_index, end_index, min_gap=0.15):
+        """
+        Chunk boundaries inside (start_index, end_index) where the capture time jumps
+        by at least min_gap seconds, i.e. where the VAD dropped silence. Returns
+        [(absolute index, gap seconds)].
+        """
+        pauses = []
+        i = max(1, bisect_right(self.chunk_index, start_index))
+        while i < len(self.chunk_index) and self.chunk_index[i] < end_index:
+            expected = self.chunk_time[i - 1] + (self.chunk_index[i] - self.chunk_index[i - 1]) / self.sample_rate
+            gap = self.chunk_time[i] - expected
+            if gap >= min_gap:
+                pauses.append((self.chunk_index[i], gap))
+            i += 1
+        return pauses
+
+    def view(self, start_index, end_index):
+        """Zero-copy float32 view of samples [start_index, end_index)."""
+        start_index = max(start_index, self.oldest_index)
+        end_index = min(end_index, self.write_index)
+        if end_index <= start_index:
+            return self.data[:0]
+        pos = start_index % self.capacity
+        return self.data[pos:pos + end_index - start_index]
+
+    def time_at(self, index):
+        """Session time of the sample at an absolute index."""
+        if not self.chunk_index:
+            return 0.0
+        i = max(0, bisect_right(self.chunk_index, index) - 1)
+        return self.chunk_time[i] + (index - self.chunk_index[i]) / self.sample_rate
+
+    def span_times(self, start_index, end_index):
+        """Session times of the start and end of the samples [start_index, end_index); gaps VAD dropped count."""
+        end_index = max(end_index, start_index + 1)
+        return self.time_at(start_index), self.time_at(end_index - 1) + 1 / self.sample_rate
+
+    def index_at(self, timestamp):
+        """Absolute index of the first sample captured at or after a session time."""
+        if not self.chunk_time:
+            return self.write_index
+        i = bisect_right(self.chunk_time, timestamp) - 1
+        if i < 0:
+            return self.chunk_index[0]
+        chunk_end = self.chunk_index[i + 1] if i + 1 < len(self.chunk_index) else self.write_index
+        offset = int(round((timestamp - self.chunk_time[i]) * self.sample_rate))
+        return min(self.chunk_index[i] + offset, chunk_end)
+
+    def view_time(self, start_time, end_time):
+        """Zero-copy view of the audio captured between two session times."""
+        return self.view(self.index_at(start_time), self.index_at(end_time))
@@ -0,0 +1,426 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import json
+from datetime import datetime
+from collections import deque
+import numpy as np
+import websockets
+from streaming_decoder import StreamingDecoder
+from ring_buffer import AudioRingBuffer
+from caption_protocol import CaptionPublisher
+from transcript_store import TranscriptStore
+from transcript_log import TranscriptLog
+from context_annotator import ContextAnnotator
+from live_annotator import LiveAnnotator
+from diarizer import DiarizationStage
+from audio_protocol import AudioFrameDecoder, SAMPLE_TYPES
+
+class Session:
+    """
+    Transcription state for a single websocket connection.
+
+    Heavy resources (Whisper, AudioProcessor, the inference executor and the batch
+    scheduler) are shared through the server; everything that describes one
+    captioning stream lives here so concurrent tabs never mix their audio.
+    """
+    def __init__(self, server, websocket):
+        self.id = uuid.uuid4().hex[:8]
+        self.server = server
+        self.websocket = websocket
+        self.audio_processor = server.audio_processor
+        self.executor = server.executor
+        self.scheduler = server.scheduler
+        self.metrics = server.metrics
+        retention = server.config["retention"]
+        # Must hold at least one full decode window
+        audio_seconds = max(retention["audio_seconds"], StreamingDecoder.MAX_DECODE_SECONDS + 5)
+        self.audio = AudioRingBuffer(capacity_seconds=audio_seconds, sample_rate=self.audio_processor.WHISPER_SAMPLE_RATE)
+        self.transcript_seconds = retention["transcript_seconds"]  # Older finalized segments are only kept in the log
+        self.start_time = datetime.utcnow()
+        self.phrase_time = None  # Session time (seconds) of the last speech frame
+        self.phrase_complete = False
+        self.socket_task = None
+        self.decoder = StreamingDecoder(self.audio, min_new_seconds=server.config["asr"].get("min_new_audio_ms", 300) / 1000)
+        self.vad = self.audio_processor.create_vad()
+        self.frame_decoder = None  # Set when the client streams framed audio (see audio_protocol.py)
+        self.raw_dtype = SAMPLE_TYPES["pcm16"]
+        self.resampler = self.audio_processor.create_resampler(self.audio.sample_rate)  # Replaced by the declared format
+        self.clock_offset = None  # Session time minus client capture time
+        self.captions = CaptionPublisher(websocket)
+        self.transcript = TranscriptStore()
+        self.log = None  # Append-only transcript log, opened when transcription starts
+        self.logged = set()  # Segment ids already written to the log
+        self.phrase_index = 0
+        self.phrase_finalized = set()  # Segment ids of the open phrase already sent for annotation
+        self.recent_final = deque(maxlen=4)  # History window used for live context prompts
+        self.live_annotator = None  # Background stages are created by start_stages() once their models are loaded
+        self.diarizer = None
+
+    def queue_stats(self):
+        stats = {"undecoded_seconds": self.decoder.buffer_duration(), **self.decoder.stats()}
+        if self.frame_decoder:
+            stats["audio"] = self.frame_decoder.stats()
+        if self.live_annotator:
+            stats["annotation"] = self.live_annotator.stats()
+        if self.diarizer:
+            stats["diarization"] = self.diarizer.stats()
+        stats["memory"] = self.memory_stats()
+        return stats
+
+    def memory_stats(self):
+        """Approximate bytes held by this session, per component."""
+        memory = {
+            "audio": self.audio.data.nbytes + sys.getsizeof(self.audio.chunk_index) + sys.getsizeof(self.audio.chunk_time),
+            "transcript": self.transcript.memory_bytes(),
+            "logged_ids": sys.getsizeof(self.logged),
+            "captions": sys.getsizeof(self.captions.sent),
+            "speakers": self.diarizer.speakers.memory_bytes() if self.diarizer else 0
+        }
+        memory["total"] = sum(memory.values())
+        memory["segments"] = len(self.transcript)
+        memory["evicted_segments"] = self.transcript.evicted
+        return memory
+
+    def start_stages(self):
+        """Creates and starts the enabled background stages whose models are ready; cheap to call every tick."""
+        models = self.server.models
+        if self.live_annotator is None and self.server.live_context and models.ready("context"):
+            self.live_annotator = LiveAnnotator(self.audio_processor.context_annotator, self.executor,
+                                                self.send_context, self.session_seconds, metrics=self.metrics)
+        if self.diarizer is None and self.server.diarization and models.ready("speaker"):
+            self.diarizer = DiarizationStage(self.audio_processor, self.audio, self.executor, self.send_speaker,
+                                             metrics=self.metrics)
+        if self.live_annotator:
+            self.live_annotator.start()
+        if self.diarizer:
+            self.diarizer.start()
+
+    def session_seconds(self):
+        return (datetime.utcnow() - self.start_time).total_seconds()
+
+    def is_running(self):
+        return self.socket_task is not None and not self.socket_task.done()
+
+    def input_seconds(self, samples):
+        return len(samples) / self.resampler.channels / self.resampler.in_rate
+
+    async def receive_audio(self, message):
+        if self.frame_decoder is None:
+            try:
+                samples = np.frombuffer(message, dtype=self.raw_dtype)
+            except ValueError as e:
+                print(f"[{self.id}] Dropping malformed audio message: {e}")
+                return
+            # Raw message: it has just arrived, so its first sample was captured one message duration ago
+            self.ingest(samples, max(0.0, self.session_seconds() - self.input_seconds(samples)))
+            return
+
+        try:
+            frames = self.frame_decoder.decode(message)
+        except Exception as e:
+            print(f"[{self.id}] Dropping malformed audio message: {e}")
+            return
+        for capture_time, samples in AudioFrameDecoder.join(frames):
+            if self.clock_offset is None:
+                # Align the client's audio clock with the session clock on the first frame
+                self.clock_offset = max(0.0, self.session_seconds() - self.input_seconds(samples)) - capture_time
+            self.ingest(samples, capture_time + self.clock_offset)
+
+    def ingest(self, samples, capture_time):
+        """
+        Resamples audio in the client's declared format to 16 kHz mono int16 and runs it,
+        captured at capture_time (session seconds), through the VAD into the ring buffer.
+        """
+        with self.metrics.time("resample"):
+            capture_time -= self.resampler.lag_seconds()  # Held-back samples from the previous chunk come out first
+            pcm = self.resampler.process(samples)
+        with self.metrics.time("vad"):
+            for samples, start_time in self.vad.process(pcm, capture_time):
+                self.audio.write(samples, start_time, scale=1 / 32768.0)
+        self.phrase_time = self.vad.last_speech_time
+
+    async def handle_action(self, message):
+        data = json.loads(message)
+        action = data.get("action")
+        match (action):
+            case "startTranscription":
+                print(f"[{self.id}] Starting transcription.")
+                # Ensure only one transcription task runs per session
+                if self.is_running():
+                    print(f"[{self.id}] Transcription is already running.")
+                    return
+
+                # Clients send audio in their native rate and layout; the server resamples it
+                audio_format = data.get("audio", {})
+                try:
+                    codec = audio_format.get("codec", "pcm16")
+                    sample_rate = int(audio_format.get("sampleRate", self.audio.sample_rate))
+                    channels = int(audio_format.get("channels", 1))
+                    if sample_rate <= 0 or channels <= 0:
+                        raise ValueError(f"invalid sample rate {sample_rate} or channel count {channels}")
+                    if audio_format.get("format") == "framed":
+                        self.frame_decoder = AudioFrameDecoder(codec, sample_rate, channels)
+                    elif codec in ("pcm16", "f32"):
+                        self.raw_dtype = SAMPLE_TYPES[codec]
+                    else:
+                        raise ValueError(f"{codec} audio must be framed")
+                    self.resampler = self.audio_processor.create_resampler(sample_rate, channels)
+                except (ImportError, ValueError) as e:
+                    print(f"[{self.id}] Unsupported audio format {audio_format}: {e}")
+                    await self.websocket.send(json.dumps({"type": "error", "message": f"Unsupported audio format: {e}"}))
+                    return
+
+                if self.log is None:
+                    self.open_log()
+
+                # Start the transcription loop as a background task
+                self.socket_task = asyncio.create_task(self.transcribe_loop())
+                self.start_stages()
+
+            case "endTranscription":
+                print(f"[{self.id}] Ending transcription.")
+                await self.stop()
+                await self.end_transcription()
+
+            case "getMetrics":
+                await self.websocket.send(json.dumps({"type": "metrics", **self.server.metrics_snapshot()}, default=str))
+
+    async def stop(self):
+        # Cancel the running socket_task if it exists
+        if self.socket_task:
+            self.socket_task.cancel()
+            try:
+                await self.socket_task  # Ensure proper cancellation
+            except asyncio.CancelledError:
+                print(f"[{self.id}] Transcription task successfully stopped.")
+            except Exception as e:
+                # The loop already ended with an error; still stop the stages and save the transcript
+                print(f"[{self.id}] Transcription task had failed: {e!r}")
+            self.socket_task = None  # Clear reference to the task
+        if self.live_annotator:
+            await self.live_annotator.stop()
+        if self.diarizer:
+            await self.diarizer.stop()
+
+    async def close(self):
+        """Called when the connection drops; saves the transcript if it was still running."""
+        if self.is_running():
+            await self.stop()
+            await self.end_transcription()
+
+    @staticmethod
+    def save_dir():
+        save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcriptions")
+        os.makedirs(save_dir, exist_ok=True)
+        return save_dir
+
+    def open_log(self):
+        log_path = os.path.join(self.save_dir(), f"session_{time.time()}_{self.id}.jsonl")
+        self.log = TranscriptLog(log_path)
+        self.log.write_header(self.id, self.start_time)
+        self.logged = set()
+
+    def log_segment(self, entry):
+        if self.log is None or entry["id"] in self.logged:
+            return
+        self.logged.add(entry["id"])
+        self.log.write_segment(entry)
+
+    def in_log(self, segment_id):
+        """True if the segment's record is in the log; evicted segments were logged before they were dropped."""
+        return segment_id in self.logged or segment_id not in self.transcript.by_id
+
+    def evict_transcript(self):
+        """Drops finalized segments older than the retention window from memory; the log keeps them."""
+        if self.log is None:
+            return
+        cutoff = self.decoder.phrase_start_time() - self.transcript_seconds
+        for entry in self.transcript.evict_before(cutoff, self.logged.__contains__):
+            self.logged.discard(entry["id"])
+
+    async def end_transcription(self):
+        if not len(self.transcript) and not self.transcript.evicted:
+            print(f"[{self.id}] Nothing to save.")
+            if self.log is not None:
+                self.log.close()
+                os.remove(self.log.path)
+                self.log = None
+            return
+        try:
+            if self.log is None:
+                self.open_log()
+            # Segments of a phrase cut off by the stop were never finalized
+            for entry in self.transcript:
+                self.log_segment(entry)
+
+            if self.transcript.evicted:
+                _, entries = await asyncio.to_thread(TranscriptLog.read, self.log.path)  # Older segments were spilled to the log
+            else:
+                entries = list(self.transcript)
+            annotator = self.audio_processor.context_annotator
+            if annotator is not None:  # None when context is disabled or the LLM is still loading
+                # Segments the live annotator already covered keep their context
+                missing = [i for i, entry in enumerate(entries) if not entry["context"]]
+                items = [(entries[i]["text"], ContextAnnotator.format_history(entries[:i])) for i in missing]
+
+                # One executor call per LLM batch so live decodes can interleave with annotation
+                for start in range(0, len(items), annotator.batch_size):
+                    with self.metrics.time("llm_annotation"):
+                        contexts = await self.executor.submit(annotator.annotate_batch, items[start:start + annotator.batch_size],
+                                                              priority="context")
+                    for i, context in zip(missing[start:], contexts):
+                        if context is not None:
+                            self.transcript.set_context(entries[i]["id"], context)
+                            self.log.write_context(entries[i]["id"], context)
+
+            # The log already holds everything; compact it and export the JSON transcript off the event loop
+            log_path = self.log.path
+            self.log.close()
+            self.log = None
+            file_path = os.path.join(self.save_dir(), "transcription_" + str(time.time()) + ".json")
+            await asyncio.to_thread(TranscriptLog.compact, log_path)
+            context_transcription = await asyncio.to_thread(TranscriptLog.export, log_path, file_path)
+
+            self.print_transcript(context_transcription)
+            print(f"Saved to {file_path}")
+        except Exception as e:
+            print(e)
+
+    def get_overlap(self, start1, end1, start2, end2):
+        """Calculate overlap duration between two time intervals."""
+        overlap = max(0, min(end1, end2) - max(start1, start2))
+        total_duration = min(end1 - start1, end2 - start2)  # Normalize by the shorter segment
+        return overlap / total_duration if total_duration > 0 else 0  # Return overlap ratio
+
+    def print_transcript(self, structured_transcription):
+        print(f"\n[TRANSCRIPT {self.id}]")
+        for entry in structured_transcription:
+                print(f"[{entry['start_time']}-{entry['end_time']}]: {entry['text']}")
+
+
+    def capture_times(self, segments, phrase_start_index):
+        """
+        Segments with session (capture) times. Decoder times count only the speech
+        kept in the ring buffer, so pauses dropped by VAD are added back by mapping
+        each boundary through the ring's capture times.
+        """
+        rate = self.audio.sample_rate
+        timed = []
+        for segment in segments:
+            start, end = self.audio.span_times(phrase_start_index + int(segment["start"] * rate),
+                                               phrase_start_index + int(segment["end"] * rate))
+            timed.append({**segment, "start": start, "end": end})
+        return timed
+
+    async def process_transcription(self, segments, phrase_start_index, captured_until=None):
+        """Updates the transcript and pushes the changes for the current phrase to the client."""
+        with self.metrics.time("segments"):
+            timed = self.capture_times(segments, phrase_start_index)
+            entries = self.transcript.replace_phrase(self.phrase_index, timed)
+            ops = self.captions.diff_phrase(self.phrase_index, timed, bool(self.phrase_complete))
+        await self.send_ops(ops)
+        if captured_until is not None:
+            self.metrics.observe("caption_latency", self.session_seconds() - captured_until)
+
+        for entry, segment in zip(entries, segments):
+            if (segment["committed"] or self.phrase_complete) and entry["id"] not in self.phrase_finalized:
+                self.finalize_segment(entry, segment, phrase_start_index)
+
+    def finalize_segment(self, entry, segment, phrase_start_index):
+        """Queues a segment that will no longer change for live context annotation and diarization."""
+        self.phrase_finalized.add(entry["id"])
+        self.log_segment(entry)
+        if self.diarizer and not entry["speaker"] and self.server.load.allow("diarization"):
+            # Segment times are phrase-relative speech time, i.e. sample offsets into the ring buffer
+            rate = self.audio.sample_rate
+            self.diarizer.submit(entry["id"], phrase_start_index + int(segment["start"] * rate),
+                                 phrase_start_index + int(segment["end"] * rate))
+        if self.live_annotator and not entry["context"] and self.server.load.allow("context"):
+            # Shed segments are annotated by the end-of-session pass
+            history = ContextAnnotator.format_history(list(self.recent_final))
+            self.live_annotator.submit(entry["id"], entry["text"], history, entry["end"])
+        self.recent_final.append(entry)
+
+    async def send_ops(self, ops):
+        try:
+            with self.metrics.time("send"):
+                await self.captions.send(ops)
+        except websockets.ConnectionClosed:
+            pass  # The connection handler cleans up the session
+
+    async def send_context(self, segment_id, context):
+        self.transcript.set_context(segment_id, context)
+        if self.log is not None and self.in_log(segment_id):
+            self.log.write_context(segment_id, context)
+        await self.send_ops([self.captions.annotation_op(segment_id, context=context)])
+
+    async def send_speaker(self, segment_id, speaker):
+        self.transcript.set_speaker(segment_id, speaker)
+        if self.log is not None and self.in_log(segment_id):
+            self.log.write_speaker(segment_id, speaker)
+        await self.send_ops([self.captions.annotation_op(segment_id, speaker=speaker)])
+
+    async def run_transcription(self):
+        """
+        Decodes the unconfirmed tail of the current phrase and updates the transcript.
+        """
+        timed_out = self.phrase_time is not None and self.session_seconds() - self.phrase_time > self.audio_processor.PHRASE_TIMEOUT
+        if not timed_out and not self.decoder.should_decode():
+            self.metrics.increment("asr_skipped_decodes")
+            return  # Too little new speech since the last decode to change the hypothesis
+
+        phrase_start_index = self.decoder.phrase_start
+        with self.metrics.time("preprocess"):
+            samples, window_offset = self.decoder.get_window()
+        # Capture time of the newest sample in the window, for end-to-end caption latency
+        captured_until = self.audio.time_at(self.decoder.window_end) if self.metrics.enabled else None
+        # Batched with other sessions' windows, conditioned on the text that precedes the window
+        prompt = self.decoder.prompt()
+        result = self.decoder.cached(prompt)
+        if result is not None:
+            self.metrics.increment("asr_cached_decodes")
+        else:
+            queued = time.perf_counter()
+            result = await self.scheduler.transcribe(samples, prompt, priority="final" if timed_out else "partial")
+            self.server.load.observe(time.perf_counter() - queued)
+            self.decoder.store(prompt, result)
+        with self.metrics.time("decoder"):
+            segments = self.decoder.update(result, window_offset)
+
+        now = self.session_seconds()
+        self.phrase_complete = self.phrase_time is not None and now - self.phrase_time > self.audio_processor.PHRASE_TIMEOUT
+
+        if self.phrase_complete:
+            segments = self.decoder.finish()  # Commit the tail and start a fresh phrase
+        elif self.decoder.needs_cut():
+            # Continuous speech: force a boundary at a pause or low-energy point to bound the decode window
+            segments = self.decoder.cut()
+            self.phrase_complete = True
+
+        await self.process_transcription(segments, phrase_start_index, captured_until)
+        if self.phrase_complete:
+            self.transcript.close_phrase(self.phrase_index)
+            self.evict_transcript()
+            self.phrase_index += 1
+            self.phrase_finalized = set()
+
+    async def transcribe_loop(self):
+        print(f"[{self.id}] Starting transcription loop...")
+
+        while True:
+            self.phrase_complete = False
+            self.start_stages()
+
+            # Audio keeps buffering in the ring while the ASR model is still loading
+            if self.decoder.has_audio() and self.server.models.ready("asr"):
+                try:
+                    await self.run_transcription()  # Decode runs on the executor, not the event loop
+                except Exception as e:
+                    # One failed decode must not end captioning; the next tick decodes the window again
+                    self.metrics.increment("transcription_errors")
+                    print(f"[{self.id}] Transcription tick failed: {e!r}")
+
+            await asyncio.sleep(self.server.load.tick())  # Longer while the server is overloaded
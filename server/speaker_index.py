@@ -0,0 +1,140 @@
+import os
+import torch
+
+class SpeakerIndex:
+    """
+    Speaker centroids kept in one contiguous, L2-normalized matrix.
+
+    Each speaker owns up to `max_prototypes` rows, so a voice that varies (e.g.
+    across microphones or emotion) is covered by several prototypes while memory
+    stays capped. A batch of embeddings is matched against every speaker with a
+    single matmul and one device sync, so matching cost stays flat as the number
+    of speakers grows. Past `max_speakers` the least recently heard speaker is
+    forgotten, so a long session never grows the matrix without bound.
+    """
+    def __init__(self, dim=192, similarity_threshold=0.4, prototype_threshold=0.75,
+                 max_prototypes=5, max_speakers=32, device="cpu"):
+        self.dim = dim
+        self.similarity_threshold = similarity_threshold  # Minimum similarity to match an existing speaker
+        self.prototype_threshold = prototype_threshold  # Below this a match adds a new prototype
+        self.max_prototypes = max_prototypes
+        self.max_speakers = max_speakers
+        self.device = device
+        self.prototypes = torch.empty((0, dim), device=device)
+        self.owners = torch.empty(0, dtype=torch.long, device=device)  # Speaker index of each row
+        self.speaker_ids = []
+        self.last_seen = []  # Assignment tick at which each speaker was last heard
+        self.ticks = 0
+        self.next_speaker_id = 0
+        self.forgotten = 0
+
+    def __len__(self):
+        return len(self.speaker_ids)
+
+    def match(self, embeddings):
+        """
+        Returns (speaker index, similarity) for each row of a (B, dim) batch, with
+        speaker index -1 when no speaker passes the threshold.
+        """
+        embeddings = torch.nn.functional.normalize(embeddings.to(self.device).view(-1, self.dim), p=2, dim=-1)
+        if not self.speaker_ids:
+            return [(-1, 0.0)] * len(embeddings)
+
+        similarities = embeddings @ self.prototypes.T  # (B, prototypes)
+        per_speaker = torch.full((len(embeddings), len(self.speaker_ids)), -1.0, device=self.device)
+        per_speaker = per_speaker.scatter_reduce(1, self.owners.expand_as(similarities), similarities, reduce="amax")
+        best_similarity, best_speaker = per_speaker.max(dim=1)
+
+        results = []
+        for speaker, similarity in zip(best_speaker.tolist(), best_similarity.tolist()):  # Single sync
+            results.append((speaker if similarity >= self.similarity_threshold else -1, similarity))
+        return results
+
+    def assign(self, embeddings):
+        """Matches a batch, creates speakers for unmatched rows and updates prototypes. Returns (speaker_id, similarity) pairs."""
+        embeddings = torch.nn.functional.normalize(embeddings.to(self.device).view(-1, self.dim), p=2, dim=-1)
+        matches = self.match(embeddings)
+        forgotten = self.forgotten
+
+        results = []
+        for embedding, (speaker, similarity) in zip(embeddings, matches):
+            if speaker < 0 or self.forgotten != forgotten:
+                # Re-check against speakers created earlier in this batch (forgetting one shifts the indices)
+                speaker, similarity = self.match(embedding.unsqueeze(0))[0]
+            if speaker < 0:
+                speaker = self.add_speaker(embedding)
+            else:
+                self.update(speaker, embedding)
+            self.ticks += 1
+            self.last_seen[speaker] = self.ticks
+            results.append((self.speaker_ids[speaker], similarity))
+        return results
+
+    def add_speaker(self, embedding):
+        if len(self.speaker_ids) >= self.max_speakers:
+            self.remove_speaker(self.last_seen.index(min(self.last_seen)))
+        speaker = len(self.speaker_ids)
+        self.speaker_ids.append(f"SPEAKER_{self.next_speaker_id}")
+        self.last_seen.append(self.ticks)
+        self.next_speaker_id += 1
+        self.add_prototype(speaker, embedding)
+        return speaker
+
+    def add_prototype(self, speaker, embedding):
+        self.prototypes = torch.cat([self.prototypes, embedding.view(1, -1)])
+        self.owners = torch.cat([self.owners, torch.tensor([speaker], device=self.device)])
+
+    def remove_speaker(self, speaker):
+        """Drops a speaker's prototypes; later speakers move down one index."""
+        keep = self.owners != speaker
+        self.prototypes = self.prototypes[keep]
+        self.owners = self.owners[keep]
+        self.owners = self.owners - (self.owners > speaker).long()
+        del self.speaker_ids[speaker]
+        del self.last_seen[speaker]
+        self.forgotten += 1
+
+    def memory_bytes(self):
+        return self.prototypes.element_size() * self.prototypes.nelement() + self.owners.element_size() * self.owners.nelement()
+
+    def update(self, speaker, embedding):
+        """Running average into the closest prototype, or a new prototype if none is close."""
+        rows = (self.owners == speaker).nonzero().view(-1)
+        similarities = self.prototypes[rows] @ embedding
+        best = int(similarities.argmax())
+        if similarities[best] < self.prototype_threshold and len(rows) < self.max_prototypes:
+            self.add_prototype(speaker, embedding)
+            return
+
+        row = rows[best]
+        # Running average to smooth variations
+        averaged = self.prototypes[row] * 0.7 + embedding * 0.3
+        self.prototypes[row] = torch.nn.functional.normalize(averaged, p=2, dim=-1)
+
+    def save(self, path):
+        """Writes the speakers to path (atomically, so a crash never leaves a truncated index)."""
+        temp_path = path + ".tmp"
+        torch.save({
+            "dim": self.dim,
+            "prototypes": self.prototypes.cpu(),
+            "owners": self.owners.cpu(),
+            "speaker_ids": self.speaker_ids,
+            "last_seen": self.last_seen,
+            "ticks": self.ticks,
+            "next_speaker_id": self.next_speaker_id
+        }, temp_path)
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        """Restores speakers saved by a previous session, keeping the `max_speakers` most recently heard."""
+        state = torch.load(path, map_location=self.device)
+        if state["dim"] != self.dim:
+            raise ValueError(f"Speaker index at {path} has dim {state['dim']}, expected {self.dim}")
+        self.prototypes = state["prototypes"].to(self.device)
+        self.owners = state["owners"].to(self.device)
+        self.speaker_ids = list(state["speaker_ids"])
+        self.last_seen = list(state["last_seen"])
+        self.ticks = state["ticks"]
+        self.next_speaker_id = state["next_speaker_id"]
+        while len(self.speaker_ids) > self.max_speakers:
+            self.remove_speaker(self.last_seen.index(min(self.last_seen)))
@@ -0,0 +1,272 @@
+import re
+import numpy as np
+
+class StreamingDecoder:
+    """
+    Incremental decoder for one phrase using a LocalAgreement-2 policy.
+
+    Audio is read from the session's AudioRingBuffer. Each tick only the
+    unconfirmed tail of the phrase (plus a short overlap) is decoded. Words that
+    two consecutive hypotheses agree on are committed, `confirmed_until` moves
+    forward and the window start moves past it, so the decode window stays
+    roughly constant instead of growing with the phrase.
+
+    When hypotheses keep disagreeing or someone talks without pausing, the window
+    and phrase would still grow, so past `max_window_seconds` / `max_phrase_seconds`
+    the session forces a phrase boundary with `cut()`. The cut point is the longest
+    VAD pause in the last `cut_search_seconds`, or failing that the quietest 100 ms.
+    The next phrase starts `overlap_seconds` before the cut and remembers the last
+    committed words, so nothing is lost or repeated across the boundary. A single
+    decode never exceeds Whisper's 30 s window, so audio is never silently truncated.
+
+    The ring only holds voiced audio, so `should_decode()` holds a tick back until
+    at least `min_new_seconds` of it arrived since the last decode; a quiet tab
+    costs no GPU time. Ring indices only ever grow, so a window is identified by
+    its indices and prompt, and `cached()` returns the previous result instead of
+    decoding identical input again (e.g. when the phrase times out after a skip).
+    """
+    MAX_DECODE_SECONDS = 30.0  # Whisper's input window
+
+    def __init__(self, audio, overlap_seconds=1.0, max_window_seconds=15.0, max_phrase_seconds=30.0, cut_search_seconds=5.0,
+                 prompt_chars=200, min_new_seconds=0.3):
+        self.audio = audio
+        self.sample_rate = audio.sample_rate
+        self.overlap_seconds = overlap_seconds
+        self.max_window_seconds = max_window_seconds
+        self.max_phrase_seconds = max_phrase_seconds
+        self.cut_search_seconds = cut_search_seconds
+        self.prompt_chars = prompt_chars
+        self.min_new_seconds = min_new_seconds
+        self.history = ""  # Committed text of earlier phrases, kept across resets for the prompt
+        self.window_end = audio.write_index
+        self.cuts = 0
+        self.decoded_until = self.window_end  # Ring index of the newest sample already decoded
+        self.last_key = None
+        self.last_result = None
+        self.skipped = 0
+        self.cache_hits = 0
+        self.reset()
+
+    def reset(self):
+        self.phrase_start = self.window_end  # Ring index of the first sample of the phrase
+        self.start_index = self.phrase_start  # Ring index of the first sample still decoded
+        self.confirmed_until = 0.0  # Everything before this phrase time (seconds) is committed
+        self.committed = []
+        self.hypothesis = []
+        self.context_words = []  # Last committed words of the previous phrase after a forced cut
+        self.finished = False
+
+    @property
+    def buffer_offset(self):
+        """Phrase time (seconds) of the first sample in the decode window."""
+        return (self.start_index - self.phrase_start) / self.sample_rate
+
+    def has_audio(self):
+        return self.audio.write_index > self.start_index
+
+    def buffer_duration(self):
+        return (self.audio.write_index - self.start_index) / self.sample_rate
+
+    def new_audio_seconds(self):
+        """Seconds of audio written since the last decode."""
+        return (self.audio.write_index - self.decoded_until) / self.sample_rate
+
+    def should_decode(self):
+        """True once enough new audio arrived since the last decode; counts the ticks it holds back."""
+        if not self.has_audio():
+            return False
+        if self.new_audio_seconds() >= self.min_new_seconds:
+            return True
+        self.skipped += 1
+        return False
+
+    def window_key(self, prompt):
+        return self.phrase_start, self.start_index, self.window_end, prompt
+
+    def cached(self, prompt):
+        """Result of the last decode if the window from get_window() is identical to it, else None."""
+        if self.last_key is not None and self.last_key == self.window_key(prompt):
+            self.cache_hits += 1
+            return self.last_result
+        return None
+
+    def store(self, prompt, result):
+        self.last_key = self.window_key(prompt)
+        self.last_result = result
+        self.decoded_until = self.window_end
+
+    def stats(self):
+        return {"forced_cuts": self.cuts, "skipped_decodes": self.skipped, "cached_decodes": self.cache_hits}
+
+    def phrase_start_time(self):
+        """Session time (seconds) at which the current phrase started."""
+        return self.audio.time_at(self.phrase_start)
+
+    def remember(self):
+        """Adds the closing phrase's committed text to the prompt history."""
+        self.history = (self.history + "".join(w["word"] for w in self.committed))[-self.prompt_chars * 2:]
+
+    def prompt(self):
+        """
+        Rolling text context for the next decode: committed text of earlier phrases
+        plus committed words of this phrase that are no longer in the window. Words
+        still inside the overlap are left out since the window itself contains them.
+        """
+        before = "".join(w["word"] for w in self.committed if w["end"] <= self.buffer_offset)
+        text = self.history + before
+        if len(text) > self.prompt_chars:
+            text = text[-self.prompt_chars:]
+            text = text[text.find(" ") + 1:]  # Start on a whole word
+        return text.strip() or None
+
+    def get_window(self):
+        """Returns a zero-copy view of the samples to decode and their phrase time offset."""
+        if self.start_index < self.audio.oldest_index:
+            print("Decoder fell behind the audio ring buffer, dropping overwritten audio.")
+            self.start_index = self.audio.oldest_index
+        # After a backlog (e.g. while the model loads) decode the first 30 s now and the rest after a cut
+        self.window_end = min(self.audio.write_index, self.start_index + int(self.MAX_DECODE_SECONDS * self.sample_rate))
+        return self.audio.view(self.start_index, self.window_end), self.buffer_offset
+
+    def update(self, result, window_offset):
+        """
+        Applies a Whisper result (decoded with word_timestamps=True) for the window
+        returned by get_window, commits the agreed prefix and returns the phrase segments.
+        """
+        new_words = self.filter_words(self.extract_words(result, window_offset))
+
+        agreed = 0
+        for previous, current in zip(self.hypothesis, new_words):
+            if self.normalize(previous["word"]) != self.normalize(current["word"]):
+                break
+            agreed += 1
+
+        if agreed:
+            self.committed.extend(new_words[:agreed])
+            self.confirmed_until = self.committed[-1]["end"]
+            self.trim_buffer()
+        self.hypothesis = new_words[agreed:]
+
+        return self.segments()
+
+    def finish(self):
+        """Commits whatever is left of the last hypothesis and resets for the next phrase."""
+        self.committed.extend(self.hypothesis)
+        self.hypothesis = []
+        self.finished = True
+        segments = self.segments()
+        self.remember()
+        self.reset()
+        return segments
+
+    def needs_cut(self):
+        """True when the decoded window or the phrase is longer than the limits allow."""
+        window = (self.window_end - self.start_index) / self.sample_rate
+        phrase = (self.window_end - self.phrase_start) / self.sample_rate
+        return window > self.max_window_seconds or phrase > self.max_phrase_seconds
+
+    def find_cut(self):
+        """Absolute ring index of a safe forced boundary in the decoded, unconfirmed audio."""
+        rate = self.sample_rate
+        low = max(self.start_index, self.phrase_start + int(self.confirmed_until * rate),
+                  self.window_end - int(self.cut_search_seconds * rate))
+        high = self.window_end - int(0.2 * rate)  # Leave the newest, possibly half-spoken word to the next phrase
+        if high <= low:
+            return low
+
+        pauses = self.audio.pauses(low, high)
+        if pauses:
+            return max(pauses, key=lambda pause: pause[1])[0]
+
+        frame = rate // 100
+        samples = self.audio.view(low, high)
+        count = len(samples) // frame
+        if count < 10:
+            return high
+        energy = np.square(samples[:count * frame]).reshape(count, frame).mean(axis=1)
+        quietest = int(np.argmin(np.convolve(energy, np.ones(10), mode="valid")))  # 100 ms windows
+        return low + (quietest + 5) * frame
+
+    def cut(self):
+        """Forces a phrase boundary at find_cut(); returns the final segments of the phrase being closed."""
+        cut_index = self.find_cut()
+        cut_time = (cut_index - self.phrase_start) / self.sample_rate
+        self.committed.extend(w for w in self.hypothesis if w["start"] < cut_time)
+        self.hypothesis = []
+        self.finished = True
+        segments = self.segments()
+        carry = self.committed[-5:]
+        self.cuts += 1
+
+        # The next phrase starts overlap_seconds before the cut for acoustic context;
+        # words that start before the cut are already committed and get filtered out
+        self.window_end = max(cut_index - int(self.overlap_seconds * self.sample_rate), self.phrase_start, self.audio.oldest_index)
+        shift = (self.window_end - self.phrase_start) / self.sample_rate
+        self.remember()
+        self.reset()
+        self.confirmed_until = (cut_index - self.phrase_start) / self.sample_rate
+        self.context_words = [{**w, "start": w["start"] - shift, "end": w["end"] - shift} for w in carry]
+        return segments
+
+    def extract_words(self, result, window_offset):
+        words = []
+        for segment in result.get("segments", []):
+            for word in segment.get("words", []):
+                words.append({
+                    "word": word["word"],
+                    "start": window_offset + word["start"],
+                    "end": window_offset + word["end"]
+                })
+        return words
+
+    def filter_words(self, words):
+        """Drops words from the overlap window that are already committed."""
+        words = [w for w in words if w["start"] > self.confirmed_until - 0.1]
+
+        # The overlap can re-emit the last few committed words with slightly shifted
+        # timestamps, so also strip the longest n-gram the two sides share.
+        previous = self.committed or self.context_words
+        if words and previous and abs(words[0]["start"] - self.confirmed_until) < 1.0:
+            for n in range(min(len(previous), len(words), 5), 0, -1):
+                tail = [self.normalize(w["word"]) for w in previous[-n:]]
+                head = [self.normalize(w["word"]) for w in words[:n]]
+                if tail == head:
+                    words = words[n:]
+                    break
+        return words
+
+    def trim_buffer(self):
+        """Moves the window start up to confirmed_until, keeping overlap_seconds of context."""
+        keep_from = self.phrase_start + int((self.confirmed_until - self.overlap_seconds) * self.sample_rate)
+        self.start_index = min(max(self.start_index, keep_from), self.window_end)
+
+    def segments(self):
+        """
+        Groups committed words into finished sentence segments. The open sentence
+        (committed words after the last sentence end plus the hypothesis) is
+        returned last as an uncommitted segment, since it can still grow.
+        """
+        segments = []
+        current = []
+        for word in self.committed:
+            current.append(word)
+            if word["word"].rstrip().endswith((".", "?", "!")):
+                segments.append(self.make_segment(current, True))
+                current = []
+        current.extend(self.hypothesis)
+        if current:
+            segments.append(self.make_segment(current, self.finished))
+        return segments
+
+    @staticmethod
+    def make_segment(words, committed):
+        return {
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "text": "".join(w["word"] for w in words),
+            "committed": committed
+        }
+
+    @staticmethod
+    def normalize(word):
+        return re.sub(r"[^\w']", "", word.lower())
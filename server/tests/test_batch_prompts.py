@@ -0,0 +1,95 @@
+"""
+Checks that WhisperModel.transcribe_batch decodes windows from different
+sessions, each with its own rolling prompt, in one shared decoder pass, that
+every window gets the same result as when it is decoded on its own, and that
+word timestamps (always requested by the live server) are aligned.
+
+Uses a randomly initialized Whisper with the tiny dimensions, so it runs on a
+CPU without downloading weights (the text is gibberish, the decoding path is
+the real one).
+
+    python tests/test_batch_prompts.py
+"""
+import os
+import sys
+import numpy as np
+import torch
+import whisper
+from whisper.model import Whisper, ModelDimensions
+from whisper.decoding import DecodingTask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import whisper_model
+from whisper_model import WhisperModel
+
+TINY = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=384, n_audio_head=6, n_audio_layer=4,
+                       n_vocab=51865, n_text_ctx=448, n_text_state=384, n_text_head=6, n_text_layer=4)
+
+PROMPTS = [
+    "We were talking about the history of the Roman empire, how its roads connected the provinces across Europe, "
+    "and why the legions could move so quickly between the frontiers of the empire.",
+    "The quarterly earnings call covered revenue growth, operating margins and the guidance for the next fiscal "
+    "year, and the analysts asked several questions about the new product line and its launch.",
+    "In this lecture we derive the wave equation from first principles, discuss the boundary conditions for a "
+    "vibrating string and then look at the normal modes and the energy of the system."
+]
+
+def random_model():
+    torch.manual_seed(0)
+    network = Whisper(TINY).eval()
+    load_model = whisper.load_model
+    whisper_model.whisper.load_model = lambda *args, **kwargs: network
+    try:
+        model = WhisperModel("tiny", device="cpu")
+    finally:
+        whisper_model.whisper.load_model = load_model
+    model.TEMPERATURES = (0.0,)  # Random weights fail every quality check; one pass is enough here
+    model.NO_SPEECH_THRESHOLD = 1.0  # and never count as silence
+    return model
+
+def test_sessions_share_one_decoder_pass():
+    model = random_model()
+    rng = np.random.default_rng(0)
+    windows = [(0.1 * rng.standard_normal(4 * 16000)).astype(np.float32) for _ in PROMPTS]
+    assert all(len(model.prompt_tokens(prompt)) == WhisperModel.PROMPT_TOKEN_BUCKETS[0] for prompt in PROMPTS)
+
+    # Record the initial tokens every row is sampled from (after the per-row prompts are written)
+    row_tokens = []
+    main_loop = DecodingTask._main_loop
+    def recording_main_loop(task, audio_features, tokens):
+        row_tokens.append(tokens[:, :task.sample_begin].tolist())
+        return main_loop(task, audio_features, tokens)
+    DecodingTask._main_loop = recording_main_loop
+    try:
+        batched = model.transcribe_batch(windows, PROMPTS)
+    finally:
+        DecodingTask._main_loop = main_loop
+
+    assert model.stats()["decoder_passes"] == 1, model.stats()
+    assert len(row_tokens) == 1 and len(row_tokens[0]) == len(PROMPTS)
+    for tokens, prompt in zip(row_tokens[0], PROMPTS):
+        expected = model.prompt_tokens(prompt)
+        assert tokens[0] == model.tokenizer.sot_prev and tokens[1:1 + len(expected)] == expected
+
+    solo = [model.transcribe_batch([window], [prompt])[0] for window, prompt in zip(windows, PROMPTS)]
+    for batched_result, solo_result in zip(batched, solo):
+        assert [s["tokens"] for s in batched_result["segments"]] == [s["tokens"] for s in solo_result["segments"]]
+
+def test_word_timestamps():
+    # The live server always decodes with word timestamps (LocalAgreement compares words)
+    model = random_model()
+    rng = np.random.default_rng(1)
+    windows = [(0.1 * rng.standard_normal(4 * 16000)).astype(np.float32) for _ in PROMPTS]
+    results = model.transcribe_batch(windows, PROMPTS, word_timestamps=True)
+    assert any(result["segments"] for result in results)
+    for window, result in zip(windows, results):
+        for segment in result["segments"]:
+            assert "words" in segment
+            for word in segment["words"]:
+                assert 0.0 <= word["start"] <= word["end"] <= len(window) / 16000 + 0.02
+
+if __name__ == "__main__":
+    test_sessions_share_one_decoder_pass()
+    test_word_timestamps()
+    print("ok")
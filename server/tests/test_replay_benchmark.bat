@@ -0,0 +1,4 @@
+@echo off
+cd /d "C:\Users\buiph\OneDrive\Documents\GitHub\cs150\server"
+call venv\scripts\activate.bat
+python tests\test_replay_benchmark.py --clients 4 --speed 1 --reference ..\testing_files\transcription_youtube.txt
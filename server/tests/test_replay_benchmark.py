@@ -0,0 +1,325 @@
+"""
+Headless replay benchmark for the caption server.
+
+Streams a WAV file into an in-process TranscriptionServer over a local websocket
+from N concurrent clients, at real time or accelerated, and reports caption
+latency percentiles, ASR real-time factor, peak CPU/GPU memory and the WER of
+each client's final captions against a reference transcript.
+
+By default every model is a stub (see STUB_CONFIG) so it runs on a CPU-only box;
+use --models config to benchmark the backends configured in server/config.json.
+
+    python tests/test_replay_benchmark.py --clients 4 --speed 2
+    python tests/test_replay_benchmark.py --models config --reference ../testing_files/transcription_youtube.txt
+"""
+import os
+import re
+import copy
+import sys
+import glob
+import json
+import time
+import wave
+import asyncio
+import argparse
+import numpy as np
+import psutil
+import websockets
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTING_DIR = os.path.join(os.path.dirname(SERVER_DIR), "testing_files")
+sys.path.insert(0, SERVER_DIR)
+
+from config import load_config, merge, DEFAULT_CONFIG
+from websocket import TranscriptionServer
+from audio_protocol import encode_message
+from resampler import resample
+
+SAMPLE_RATE = 16000  # What the server decodes; clients may stream other rates (--input-rate)
+
+STUB_CONFIG = {
+    "asr": {"backend": "stub", "rtf": 0.02},
+    "llm": {"backend": "stub", "per_prompt_latency": 0.05},
+    "vad": {"backend": "energy"},
+    "stages": {"live_context": True, "diarization": False}
+}
+
+def load_wav(path, sample_rate=SAMPLE_RATE):
+    """Reads a 16-bit WAV and returns it as mono int16 at sample_rate."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+    return resample(samples, rate, sample_rate, channels)
+
+def load_reference(path):
+    """Reads a transcript like transcription_youtube.txt, skipping the title and timestamp lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    if lines and "|" in lines[0]:
+        lines = lines[1:]  # "Title | URL" header
+    return " ".join(line for line in lines if line and not re.fullmatch(r"\d+(:\d{2})+", line))
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower().replace("’", "'")).split()
+
+def word_error_rate(reference, hypothesis):
+    """(substitutions + deletions + insertions) / reference words, via word-level edit distance."""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+def session_files():
+    """Transcripts and session logs the server writes when a client ends its session."""
+    save_dir = os.path.join(SERVER_DIR, "transcriptions")
+    return set(glob.glob(os.path.join(save_dir, "transcription_*.json")) + glob.glob(os.path.join(save_dir, "session_*.jsonl")))
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": len(values),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max())
+    }
+
+class ReplayClient:
+    """
+    One simulated extension tab: streams 20 ms PCM frames and applies the caption ops it
+    receives. "framed" packs `frames_per_message` frames with their capture times into
+    each message like the extension does; "raw" sends one bare message per frame.
+    Audio is sent at `sample_rate` as int16 ("pcm16") or float32 ("f32") samples.
+    """
+    def __init__(self, uri, pcm, speed=1.0, audio_format="framed", frames_per_message=5, settle_seconds=3.0,
+                 sample_rate=SAMPLE_RATE, codec="pcm16"):
+        self.uri = uri
+        self.pcm = pcm.astype(np.float32) / 32768.0 if codec == "f32" else pcm
+        self.speed = speed
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.codec = codec
+        self.frame = sample_rate // 50
+        self.frames_per_message = frames_per_message if audio_format == "framed" else 1
+        self.seq = 0
+        self.settle_seconds = settle_seconds
+        self.captions = {}  # segment id -> {"start", "end", "text", "final"}
+        self.latencies = []  # Caption text received - capture time of its last word (seconds, 1x only)
+        self.messages = 0
+        self.connected_at = None
+        self.websocket = None
+        self.refused = False
+
+    async def run(self):
+        try:
+            await self.replay()
+        except websockets.InvalidStatus as e:
+            self.refused = True  # Turned away by the server's admission control
+            print(f"Connection refused: {e}")
+
+    async def replay(self):
+        async with websockets.connect(self.uri, max_size=None) as websocket:
+            self.websocket = websocket
+            self.connected_at = time.monotonic()
+            start = {"action": "startTranscription"}
+            if self.audio_format == "framed" or self.sample_rate != SAMPLE_RATE or self.codec != "pcm16":
+                start["audio"] = {"format": self.audio_format, "codec": self.codec, "sampleRate": self.sample_rate}
+            await websocket.send(json.dumps(start))
+            receiver = asyncio.create_task(self.receive())
+
+            await self.stream(self.pcm, self.speed)
+            # Trailing silence at real time so the last phrase times out and is finalized
+            await self.stream(np.zeros(int(self.settle_seconds * self.sample_rate), dtype=self.pcm.dtype), 1.0)
+
+            await websocket.send(json.dumps({"action": "endTranscription"}))
+            await asyncio.sleep(0.5)
+            receiver.cancel()
+
+    async def stream(self, pcm, speed):
+        next_send = time.monotonic()
+        frames = []
+        for start in range(0, len(pcm), self.frame):
+            # Capture time on the client's clock, which runs at wall-clock speed like a real tab
+            frames.append((self.seq, time.monotonic() - self.connected_at, pcm[start:start + self.frame]))
+            self.seq += 1
+            if len(frames) == self.frames_per_message:
+                await self.send_frames(frames)
+                frames = []
+            next_send += self.frame / self.sample_rate / speed
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+        if frames:
+            await self.send_frames(frames)
+
+    async def send_frames(self, frames):
+        if self.audio_format == "framed":
+            await self.websocket.send(encode_message(frames, self.codec))
+        else:
+            await self.websocket.send(frames[0][2].tobytes())
+
+    async def receive(self):
+        async for message in self.websocket:
+            data = json.loads(message)
+            if data.get("type") == "captions":
+                self.messages += 1
+                self.apply_ops(data["ops"])
+
+    def apply_ops(self, ops):
+        # The session clock starts when the connection is accepted, so caption
+        # times are (approximately) seconds since connected_at
+        now = time.monotonic() - self.connected_at
+        for op in ops:
+            if op["op"] == "remove":
+                self.captions.pop(op["id"], None)
+                continue
+            caption = self.captions.setdefault(op["id"], {"start": 0.0, "end": 0.0, "text": "", "final": False})
+            if "text" in op:
+                caption["text"] = caption["text"][:op.get("text_from", 0)] + op["text"]
+            for key in ("start", "end", "final"):
+                if key in op:
+                    caption[key] = op[key]
+            if "text" in op and self.speed == 1.0:
+                # Caption times are session seconds of the audio, which only track
+                # the wall clock when streaming at real time
+                self.latencies.append(now - caption["end"])
+
+    def transcript(self):
+        return " ".join(c["text"].strip() for c in sorted(self.captions.values(), key=lambda c: c["start"]))
+
+class MemoryMonitor:
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_rss = self.process.memory_info().rss
+
+    async def run(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def peak_gpu():
+        torch = sys.modules.get("torch")
+        if torch is None or not torch.cuda.is_available():
+            return None
+        return torch.cuda.max_memory_allocated()
+
+async def benchmark(config, pcm, clients, speed, audio_format, settle_seconds, reference=None,
+                    sample_rate=SAMPLE_RATE, codec="pcm16"):
+    server = TranscriptionServer(config)
+    server.start_models()
+    await server.models.wait_all()  # Benchmark steady state, not model loading
+    monitor = MemoryMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+
+    before = session_files()
+    try:
+        async with websockets.serve(server.handle_connection, "localhost", 0, process_request=server.process_request) as ws_server:
+            uri = f"ws://localhost:{ws_server.sockets[0].getsockname()[1]}"
+            replay = [ReplayClient(uri, pcm, speed, audio_format, settle_seconds=settle_seconds, sample_rate=sample_rate, codec=codec)
+                      for _ in range(clients)]
+            started = time.monotonic()
+            await asyncio.gather(*(client.run() for client in replay))
+            wall = time.monotonic() - started
+    finally:
+        monitor_task.cancel()
+        server.executor.shutdown(wait=False)
+        # Every client saves a transcript and a session log; the benchmark only needs the report
+        for path in session_files() - before:
+            os.remove(path)
+
+    snapshot = server.metrics.snapshot()
+    latencies = [lag for client in replay for lag in client.latencies]
+    audio_seconds = len(pcm) / sample_rate
+    report = {
+        "clients": clients,
+        "speed": speed,
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall,
+        "caption_latency": snapshot["stages"].get("caption_latency"),
+        "client_caption_latency": percentiles(latencies),
+        "caption_messages": sum(client.messages for client in replay),
+        "asr_rtf": snapshot["stages"].get("asr_rtf"),
+        "decoded_audio_seconds": snapshot["counters"].get("asr_audio_seconds", 0.0),
+        "skipped_decodes": snapshot["counters"].get("asr_skipped_decodes", 0),
+        "cached_decodes": snapshot["counters"].get("asr_cached_decodes", 0),
+        "average_batch_size": server.scheduler.average_batch_size(),
+        "peak_rss_mb": monitor.peak_rss / 2 ** 20,
+        "peak_gpu_mb": MemoryMonitor.peak_gpu() / 2 ** 20 if MemoryMonitor.peak_gpu() is not None else None,
+        "models": server.models.readiness(),
+        "load": server.load.stats(),
+        "stages": snapshot["stages"]
+    }
+    if reference is not None:
+        report["wer"] = [word_error_rate(reference, client.transcript()) for client in replay if not client.refused]
+    return report
+
+def print_report(report):
+    print("\n[REPLAY BENCHMARK]")
+    print(f"{report['clients']} client(s), {report['audio_seconds']:.1f} s of audio at {report['speed']}x, "
+          f"{report['wall_seconds']:.1f} s wall")
+    for label, key in (("Caption latency (server)", "caption_latency"), ("Caption latency (client)", "client_caption_latency")):
+        latency = report[key]
+        if latency and latency["count"]:
+            print(f"{label}: p50 {latency['p50']:.3f} s, p95 {latency['p95']:.3f} s, "
+                  f"p99 {latency['p99']:.3f} s, max {latency['max']:.3f} s ({latency['count']} updates)")
+    if report["asr_rtf"]:
+        print(f"ASR real-time factor: mean {report['asr_rtf']['mean']:.3f}, p95 {report['asr_rtf']['p95']:.3f}, "
+              f"average batch {report['average_batch_size']:.2f}")
+    print(f"Decoded {report['decoded_audio_seconds']:.1f} s of audio; skipped {report['skipped_decodes']} ticks, "
+          f"{report['cached_decodes']} decodes served from cache")
+    load = report["load"]
+    print(f"Load: ended {load['level']}, shed {load['shed']}, {load['fallback_windows']} fallback window(s), "
+          f"{load['rejected_connections']} refused connection(s)")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB" +
+          (f", peak GPU: {report['peak_gpu_mb']:.0f} MB" if report["peak_gpu_mb"] is not None else ""))
+    if "wer" in report:
+        print("WER per client: " + ", ".join(f"{wer:.3f}" for wer in report["wer"]))
+    for name, stage in report["stages"].items():
+        print(f"  {name:<16} n={stage['count']:<6} p50={stage['p50']:.4f} p95={stage['p95']:.4f} max={stage['max']:.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav", default=os.path.join(TESTING_DIR, "recording_test.wav"))
+    parser.add_argument("--reference", help="Reference transcript for WER, e.g. testing_files/transcription_youtube.txt")
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, 1.0 is real time")
+    parser.add_argument("--audio-format", choices=["framed", "raw"], default="framed")
+    parser.add_argument("--input-rate", type=int, default=SAMPLE_RATE,
+                        help="Sample rate the clients stream at; the server resamples to 16 kHz")
+    parser.add_argument("--codec", choices=["pcm16", "f32"], default="pcm16", help="Sample format the clients stream")
+    parser.add_argument("--settle", type=float, default=3.0, help="Seconds of trailing silence per client")
+    parser.add_argument("--models", choices=["stub", "config"], default="stub",
+                        help="stub: CPU-only stand-ins; config: the backends in server/config.json")
+    parser.add_argument("--output", help="Also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    if args.models == "stub":
+        config = merge(copy.deepcopy(DEFAULT_CONFIG), STUB_CONFIG)
+    else:
+        config = load_config()
+    config["metrics"] = {"enabled": True, "log_interval": 0}
+
+    pcm = load_wav(args.wav, args.input_rate)
+    reference = load_reference(args.reference) if args.reference else None
+    report = asyncio.run(benchmark(config, pcm, args.clients, args.speed, args.audio_format, args.settle, reference,
+                                   sample_rate=args.input_rate, codec=args.codec))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    main()
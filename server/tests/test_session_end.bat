@@ -0,0 +1,4 @@
+@echo off
+cd /d "C:\Users\buiph\OneDrive\Documents\GitHub\cs150\server"
+call venv\scripts\activate.bat
+python tests\test_session_end.py
@@ -0,0 +1,133 @@
+"""
+Checks that ending a session saves its transcript when no context annotator is
+loaded (context disabled, or the LLM still loading), and when a decode raised
+while the session ran: streams a few tone bursts into an in-process
+TranscriptionServer with stub models, sends endTranscription and expects a
+transcription_<time>.json with the decoded segments. Also checks that segment
+times are capture times, i.e. pauses dropped by VAD still count.
+
+    python tests/test_session_end.py
+"""
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import asyncio
+import numpy as np
+import websockets
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from config import merge, DEFAULT_CONFIG
+from websocket import TranscriptionServer
+from audio_protocol import encode_message
+
+SAMPLE_RATE = 16000
+FRAME = SAMPLE_RATE // 50
+
+NO_CONTEXT_CONFIG = {
+    "asr": {"backend": "stub"},
+    "vad": {"backend": "energy"},
+    "stages": {"context": False, "live_context": False, "diarization": False}
+}
+
+def tone_bursts(count=4, burst_seconds=0.4, gap_seconds=0.3):
+    """Tone bursts separated by silence; the stub ASR decodes each burst as one word."""
+    t = np.arange(int(burst_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    burst = (0.3 * 32767 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    gap = np.zeros(int(gap_seconds * SAMPLE_RATE), dtype=np.int16)
+    return np.concatenate([np.concatenate([burst, gap]) for _ in range(count)])
+
+class FailingModel:
+    """Wraps an ASR backend and raises on its `fail_on`-th batch, like a decode hitting a CUDA error."""
+    def __init__(self, model, fail_on=3):
+        self.model = model
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def transcribe_batch(self, windows, prompts=None, word_timestamps=False):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise TypeError("simulated decode failure")
+        return self.model.transcribe_batch(windows, prompts, word_timestamps)
+
+    def stats(self):
+        return self.model.stats()
+
+def transcription_files(pattern="transcription_*.json"):
+    return set(glob.glob(os.path.join(SERVER_DIR, "transcriptions", pattern)))
+
+async def run_session(wrap_model=None, gap_seconds=0.3, timeout=15.0):
+    """Streams tone bursts through one session and ends it; returns the new transcript and log paths."""
+    server = TranscriptionServer(merge(copy.deepcopy(DEFAULT_CONFIG), NO_CONTEXT_CONFIG))
+    server.start_models()
+    await server.models.wait_all()
+    assert server.audio_processor.context_annotator is None
+    if wrap_model:
+        server.scheduler.model = wrap_model(server.scheduler.model)
+
+    before = transcription_files() | transcription_files("session_*.jsonl")
+    async with websockets.serve(server.handle_connection, "localhost", 0, process_request=server.process_request) as ws_server:
+        uri = f"ws://localhost:{ws_server.sockets[0].getsockname()[1]}"
+        async with websockets.connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "startTranscription",
+                                             "audio": {"format": "framed", "codec": "pcm16", "sampleRate": SAMPLE_RATE}}))
+            pcm = tone_bursts(count=8, gap_seconds=gap_seconds)
+            for seq, start in enumerate(range(0, len(pcm), FRAME)):
+                # Capture times follow the audio clock, so the test does not depend on how fast frames are sent
+                await websocket.send(encode_message([(seq, start / SAMPLE_RATE, pcm[start:start + FRAME])]))
+                await asyncio.sleep(0.005)
+            await asyncio.sleep(1.0)  # Let a few transcription ticks decode the audio
+            await websocket.send(json.dumps({"action": "endTranscription"}))
+
+            deadline = time.monotonic() + timeout
+            while not transcription_files() - before and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+    server.executor.shutdown(wait=False)
+    return sorted(transcription_files() - before), sorted(transcription_files("session_*.jsonl") - before)
+
+def parse_time(text):
+    hours, minutes, seconds = text.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def check_saved(saved, logs):
+    try:
+        assert len(saved) == 1, "no transcript was saved"
+        with open(saved[0]) as f:
+            transcript = json.load(f)
+        assert transcript, "the saved transcript is empty"
+        assert all(entry["text"].strip() and entry["context"] == "" for entry in transcript)
+        return transcript
+    finally:
+        for path in saved + logs:
+            os.remove(path)
+
+def test_end_transcription_without_annotator():
+    check_saved(*asyncio.run(run_session()))
+
+def test_end_transcription_after_failed_decode():
+    models = []
+    def wrap_model(model):
+        models.append(FailingModel(model))
+        return models[0]
+    check_saved(*asyncio.run(run_session(wrap_model)))
+    assert models[0].calls > models[0].fail_on, "captioning stopped after the failed decode"
+
+def test_segment_times_include_pauses():
+    # 1 s gaps: VAD keeps 0.5 s of each (pre-roll and hangover), the ring buffer never sees the rest
+    transcript = check_saved(*asyncio.run(run_session(gap_seconds=1.0)))
+    first = parse_time(transcript[0]["start_time"])  # Onset of the first burst
+    for entry in transcript:
+        # Segment boundaries fall on burst onsets (every 1.4 s) and burst ends 0.4 s later
+        for offset, boundary in ((0.0, entry["start_time"]), (0.4, entry["end_time"])):
+            bursts = (parse_time(boundary) - first - offset) / 1.4
+            assert abs(bursts - round(bursts)) < 0.05, f"{boundary} is not on a burst boundary"
+
+if __name__ == "__main__":
+    test_end_transcription_without_annotator()
+    test_end_transcription_after_failed_decode()
+    test_segment_times_include_pauses()
+    print("ok")
@@ -1,3 +1,4 @@
+import os
 import sys
 import pyaudio
 import numpy as np
@@ -11,6 +12,9 @@ from datetime import datetime, timedelta
 from PyQt6.QtWidgets import QApplication, QTextEdit, QVBoxLayout, QWidget, QPushButton, QFileDialog
 from PyQt6.QtCore import QThread, pyqtSignal
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resampler import resample
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -100,15 +104,9 @@ class TranscriptionThread(QThread):
                 raw_data = bytes(audio_buffer)
                 audio_buffer.clear()
 
-            # Convert raw PCM to float32 numpy array
-            samples = np.frombuffer(raw_data, dtype=np.int16).astype(np.float32)
-            audio_tensor = torch.from_numpy(samples)
-            audio_tensor_16k = torch.nn.functional.interpolate(
-                audio_tensor.unsqueeze(0).unsqueeze(0),
-                scale_factor=WHISPER_SAMPLE_RATE / INPUT_SAMPLE_RATE,
-                mode='linear',
-                align_corners=False
-            ).squeeze().numpy() / 32768.0
+            # Resample the raw PCM to 16 kHz float32 with the server's anti-aliased resampler
+            samples = np.frombuffer(raw_data, dtype=np.int16)
+            audio_tensor_16k = resample(samples, INPUT_SAMPLE_RATE, WHISPER_SAMPLE_RATE).astype(np.float32) / 32768.0
 
             try:
                 # Run Whisper transcription
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from transcript_store import TranscriptStore
+
+class TranscriptLog:
+    """
+    Append-only JSON Lines log of one session's transcript.
+
+    Segments are appended as they are finalized and annotations (context,
+    speaker) as later records referring to the segment id, so nothing already
+    written is ever rewritten:
+
+        {"type": "session", "session": "1f3a9c2e", "started": "2025-04-01T12:00:00"}
+        {"type": "segment", "id": "0-0", "start": 0.78, "end": 4.24, "text": " Hello.", "speaker": null, "context": ""}
+        {"type": "context", "id": "0-0", "context": "..."}
+        {"type": "speaker", "id": "0-0", "speaker": "SPEAKER_0"}
+
+    Every record is flushed to the OS immediately and fsynced at most every
+    `fsync_interval` seconds on a worker thread, so a crash loses at most that
+    much and the event loop never blocks on the disk. A truncated last line from
+    a crash is ignored when reading. `compact` rewrites the log with annotations
+    merged and segments sorted by start time, which `read_range` can binary search.
+    """
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.file = open(path, "a", encoding="utf-8")
+        self.last_sync = time.monotonic()
+        self.sync_pending = None
+        self.sync_lock = threading.Lock()  # Keeps close() from closing the fd under a running fsync
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync_soon()
+
+    def sync_soon(self):
+        if self.sync_pending is not None and not self.sync_pending.done():
+            return
+        self.last_sync = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self.sync_pending = loop.run_in_executor(None, self.sync)
+
+    def sync(self):
+        with self.sync_lock:
+            if not self.file.closed:  # A sync scheduled before close() has nothing left to do
+                os.fsync(self.file.fileno())
+
+    def write_header(self, session_id, started):
+        self.append({"type": "session", "session": session_id, "started": started.isoformat()})
+
+    def write_segment(self, entry):
+        self.append({
+            "type": "segment",
+            "id": entry["id"],
+            "start": entry["start"],
+            "end": entry["end"],
+            "text": entry["text"],
+            "speaker": entry["speaker"],
+            "context": entry["context"]
+        })
+
+    def write_context(self, segment_id, context):
+        self.append({"type": "context", "id": segment_id, "context": context})
+
+    def write_speaker(self, segment_id, speaker):
+        self.append({"type": "speaker", "id": segment_id, "speaker": speaker})
+
+    def close(self):
+        with self.sync_lock:  # Waits for a background fsync that is still running
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        self.sync_pending = None
+
+    @staticmethod
+    def records(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping a truncated record in {path}.")  # Last line of a crashed session
+
+    @staticmethod
+    def read(path):
+        """Replays the log and returns the header and the segments (annotations applied) sorted by start."""
+        header = {}
+        segments = {}
+        for record in TranscriptLog.records(path):
+            kind = record.get("type")
+            if kind == "session":
+                header = record
+            elif kind == "segment":
+                segments[record["id"]] = record
+            elif kind in ("context", "speaker") and record["id"] in segments:
+                segments[record["id"]][kind] = record[kind]
+        return header, sorted(segments.values(), key=lambda segment: segment["start"])
+
+    @staticmethod
+    def compact(path):
+        """Rewrites the log as its header plus one merged segment record per line, sorted by start."""
+        header, segments = TranscriptLog.read(path)
+        header = {**header, "type": "session", "compacted": True}
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for segment in segments:
+                f.write(json.dumps(segment) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)  # Atomic, so a crash leaves either the old or the new log
+        return segments
+
+    @staticmethod
+    def read_range(path, start, end):
+        """
+        Segments starting within [start, end) seconds. On a compacted log this
+        binary searches byte offsets and reads only the matching lines; an
+        uncompacted log (still being written, or left by a crash) is replayed.
+        """
+        with open(path, "rb") as f:
+            header = json.loads(f.readline() or b"{}")
+            if not header.get("compacted"):
+                _, segments = TranscriptLog.read(path)
+                return [segment for segment in segments if start <= segment["start"] < end]
+
+            data_start = f.tell()
+            size = os.fstat(f.fileno()).st_size
+
+            def start_at(offset):
+                """Start time of the first full record at or after a byte offset."""
+                f.seek(offset)
+                if offset > data_start:
+                    f.readline()  # Skip the partial line
+                line = f.readline()
+                return json.loads(line)["start"] if line.strip() else float("inf")
+
+            # Smallest offset whose next record starts at or after `start`
+            low, high = data_start, size
+            while low < high:
+                middle = (low + high) // 2
+                if start_at(middle) < start:
+                    low = middle + 1
+                else:
+                    high = middle
+            f.seek(low)
+            if low > data_start:
+                f.readline()
+
+            segments = []
+            for line in f:
+                segment = json.loads(line)
+                if segment["start"] >= end:
+                    break
+                if segment["start"] >= start:
+                    segments.append(segment)
+            return segments
+
+    @staticmethod
+    def export(path, json_path):
+        """Writes the transcript in the saved transcription JSON format; returns the exported entries."""
+        _, segments = TranscriptLog.read(path)
+        structured = [
+            TranscriptStore.format_entry({**segment, "context": segment.get("context") or ""})
+            for segment in segments
+        ]
+        with open(json_path, "w") as f:
+            json.dump(structured, f, indent=4)
+        return structured
+
+if __name__ == "__main__":
+    # Recovers the JSON transcript of a session that did not shut down cleanly:
+    #   python transcript_log.py transcriptions/session_<time>_<id>.jsonl
+    log_path = sys.argv[1]
+    TranscriptLog.compact(log_path)
+    json_path = os.path.splitext(log_path)[0] + ".json"
+    TranscriptLog.export(log_path, json_path)
+    print(f"Saved to {json_path}")
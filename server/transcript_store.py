@@ -0,0 +1,115 @@
+import sys
+import itertools
+from sortedcontainers import SortedKeyList
+from audio_processor import AudioProcessor
+
+class TranscriptStore:
+    """
+    Session transcript kept ordered by numeric start time.
+
+    Segments are stored with start/end in seconds and only formatted as
+    "HH:MM:SS.sss" when the transcript is exported. The open phrase is rewritten
+    on every tick, so replacing a phrase only removes and inserts that phrase's
+    own segments (O(k log n)) instead of flattening and re-sorting everything.
+    `evict_before` drops old finalized segments once they are persisted elsewhere
+    (the session's TranscriptLog), so memory tracks the retention window rather
+    than the session length.
+    """
+    def __init__(self):
+        self.segments = SortedKeyList(key=lambda entry: (entry["start"], entry["seq"]))
+        self.phrases = {}  # phrase index -> entries currently stored for it
+        self.by_id = {}
+        self.seq = itertools.count()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    def replace_phrase(self, phrase_index, segments):
+        """Replaces the segments of one phrase. Segment times are session times (seconds)."""
+        previous = {}
+        for entry in self.phrases.pop(phrase_index, []):
+            self.segments.remove(entry)
+            del self.by_id[entry["id"]]
+            previous[entry["id"]] = entry
+
+        entries = []
+        for i, segment in enumerate(segments):
+            segment_id = f"{phrase_index}-{i}"
+            context = segment.get("context", "")
+            speaker = segment.get("speaker")
+            old = previous.get(segment_id)
+            if old is not None and old["text"] == segment["text"]:
+                # Keep annotations of segments that did not change
+                context = context or old["context"]
+                speaker = speaker or old["speaker"]
+            entry = {
+                "id": segment_id,
+                "seq": next(self.seq),
+                "phrase": phrase_index,
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"],
+                "context": context,
+                "speaker": speaker
+            }
+            self.segments.add(entry)
+            self.by_id[segment_id] = entry
+            entries.append(entry)
+        self.phrases[phrase_index] = entries
+        return entries
+
+    def close_phrase(self, phrase_index):
+        """Stops tracking a finished phrase; its segments stay in the transcript."""
+        self.phrases.pop(phrase_index, None)
+
+    def evict_before(self, end_time, persisted):
+        """Drops segments of closed phrases that ended before end_time and are persisted; returns them."""
+        evicted = []
+        while self.segments:
+            entry = self.segments[0]
+            if entry["end"] >= end_time or entry["phrase"] in self.phrases or not persisted(entry["id"]):
+                break
+            self.segments.pop(0)
+            del self.by_id[entry["id"]]
+            evicted.append(entry)
+        self.evicted += len(evicted)
+        return evicted
+
+    def memory_bytes(self):
+        """Approximate size of the stored entries and their strings."""
+        return sum(sys.getsizeof(entry) + sys.getsizeof(entry["text"]) + sys.getsizeof(entry["context"] or "")
+                   for entry in self.segments)
+
+    def set_context(self, segment_id, context):
+        entry = self.by_id.get(segment_id)
+        if entry is not None:
+            entry["context"] = context
+        return entry
+
+    def set_speaker(self, segment_id, speaker):
+        entry = self.by_id.get(segment_id)
+        if entry is not None:
+            entry["speaker"] = speaker
+        return entry
+
+    def time_range(self, start, end):
+        """Segments starting within [start, end) seconds."""
+        return list(self.segments.irange_key((start, -1), (end, -1), inclusive=(True, False)))
+
+    @staticmethod
+    def format_entry(entry):
+        return {
+            "speaker": entry["speaker"] or "UNKNOWN",  # Assign to UNKNOWN
+            "start_time": AudioProcessor.format_time(entry["start"]),
+            "end_time": AudioProcessor.format_time(entry["end"]),
+            "text": entry["text"],
+            "context": entry["context"]
+        }
+
+    def to_structured(self):
+        """Exports the transcript in the saved transcription JSON format."""
+        return [self.format_entry(entry) for entry in self.segments]
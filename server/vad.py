@@ -0,0 +1,99 @@
+from collections import deque
+import numpy as np
+
+class WebRtcVad:
+    """webrtcvad classifier applied to a whole batch of frames at once."""
+    def __init__(self, mode=3):
+        import webrtcvad  # Imported lazily so the energy backend needs no native package
+        self.vad = webrtcvad.Vad()
+        self.vad.set_mode(mode)
+
+    def classify(self, frames, sample_rate):
+        frame_ms = frames.shape[1] * 1000 // sample_rate
+        if frame_ms not in (10, 20, 30):
+            raise ValueError(f"webrtcvad needs 10, 20 or 30 ms frames, got {frame_ms} ms")
+        return np.fromiter((self.vad.is_speech(frame.tobytes(), sample_rate) for frame in frames),
+                           dtype=bool, count=len(frames))
+
+class EnergyVad:
+    """Vectorized RMS-energy detector; needs no native dependency and any frame size."""
+    def __init__(self, threshold_db=-45.0):
+        self.threshold_db = threshold_db
+
+    def classify(self, frames, sample_rate):
+        samples = frames.astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        return 20 * np.log10(rms + 1e-10) > self.threshold_db
+
+VAD_BACKENDS = {"webrtc": WebRtcVad, "energy": EnergyVad}
+
+class VadStage:
+    """
+    Per-session voice activity detection over arbitrary-length 16-bit PCM input.
+
+    Input is cut into fixed `frame_ms` frames (leftover samples carry over to the
+    next call) and each call classifies all its frames in one batch. Smoothing
+    keeps `padding_ms` of audio before a speech onset and `hangover_ms` after the
+    last speech frame, so word onsets and trailing consonants are not clipped.
+    """
+    def __init__(self, backend, sample_rate=16000, frame_ms=20, padding_ms=200, hangover_ms=300):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.hangover_frames = hangover_ms // frame_ms
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.remainder_time = None
+        self.preroll = deque(maxlen=padding_ms // frame_ms)  # (frame, time) held until speech starts
+        self.hangover_left = 0
+        self.last_speech_time = None  # Session time at the end of the last speech frame
+
+    def process(self, pcm, timestamp):
+        """
+        Consumes PCM captured starting at `timestamp` (session seconds). Returns the
+        (int16 samples, start time) runs that should be kept, in order.
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        start_time = timestamp
+        if len(self.remainder):
+            samples = np.concatenate([self.remainder, samples])
+            start_time = self.remainder_time
+
+        count = len(samples) // self.frame_samples
+        frame_seconds = self.frame_samples / self.sample_rate
+        self.remainder = samples[count * self.frame_samples:].copy()
+        self.remainder_time = start_time + count * frame_seconds
+        if count == 0:
+            return []
+
+        frames = samples[:count * self.frame_samples].reshape(count, self.frame_samples)
+        flags = self.backend.classify(frames, self.sample_rate)
+
+        runs = []
+        run_start = None
+        for i, is_speech in enumerate(flags):
+            frame_time = start_time + i * frame_seconds
+            if is_speech:
+                if run_start is None:
+                    runs.extend((frame, t) for frame, t in self.preroll)
+                    self.preroll.clear()
+                self.hangover_left = self.hangover_frames
+                self.last_speech_time = frame_time + frame_seconds
+                keep = True
+            elif self.hangover_left > 0:
+                self.hangover_left -= 1
+                keep = True
+            else:
+                keep = False
+
+            if keep:
+                if run_start is None:
+                    run_start = i
+            else:
+                if run_start is not None:
+                    runs.append((frames[run_start:i].reshape(-1), start_time + run_start * frame_seconds))
+                    run_start = None
+                self.preroll.append((frames[i], frame_time))
+
+        if run_start is not None:
+            runs.append((frames[run_start:].reshape(-1), start_time + run_start * frame_seconds))
+        return runs
@@ -1,192 +1,139 @@
-import os
-import time
 import asyncio
-import websockets
-import torch
 import json
-from datetime import datetime, timedelta
-from whisper_model import WhisperModel
+import websockets
+from http import HTTPStatus
+from asr_backends import load_asr_model
+from config import load_config
 from audio_processor import AudioProcessor
-from collections import defaultdict
+from inference_executor import InferenceExecutor
+from batch_scheduler import BatchScheduler
+from session import Session
+from metrics import Metrics
+from model_registry import ModelRegistry
+from load_control import LoadController
 
 class TranscriptionServer:
-    def __init__(self, host="localhost", port=8765):
-        self.host = host
-        self.port = port
-        self.model = WhisperModel()
-        self.audio_processor = AudioProcessor()
-        self.audio_queue = asyncio.Queue()
-        self.transcription_queue = asyncio.Queue()
-        self.start_time = datetime.utcnow()
-        self.phrase_time = None
-        self.phrase_complete = False
-        self.socket_task = None
-        self.batch_buffer = bytearray()
-        self.transcription_obj = [{}]
-        self.structured_transcription = None
-    
+    def __init__(self, config=None, executor=None):
+        self.config = config or load_config()
+        self.host = self.config["host"]
+        self.port = self.config["port"]
+        self.metrics = Metrics(enabled=self.config["metrics"]["enabled"])
+        stages = self.config["stages"]
+        self.audio_processor = AudioProcessor(vad_backend=self.config["vad"]["backend"], llm_config=self.config["llm"],
+                                              cache_dir=self.config["model_cache_dir"],
+                                              max_speakers=self.config["retention"]["max_speakers"],
+                                              speaker_index_path=self.config["speaker_index_path"])
+        self.executor = executor or InferenceExecutor(**self.config["executor"], metrics=self.metrics)  # Keeps model calls off the event loop
+        self.scheduler = BatchScheduler(None, self.executor, metrics=self.metrics, word_timestamps=True)  # Model set once loaded
+        # Sheds background stages, slows ticks and refuses connections when ASR latency misses the SLO
+        self.load = LoadController(**self.config["scheduling"])
+        self.load.executor = self.executor
+        self.scheduler.load = self.load
+        self.live_context = stages["context"] and stages["live_context"]  # Annotate finalized segments while the session runs
+        self.diarization = stages["diarization"]  # Assign speakers to finalized segments in the background
+        self.sessions = {}
+
+        # Nothing is loaded here; start_models() loads every enabled model concurrently in the background
+        self.models = ModelRegistry()
+        self.models.register("asr", self.load_asr_model)
+        self.models.register("asr_fallback", self.load_fallback_asr_model, enabled=bool(self.config["asr"].get("fallback_model")))
+        self.models.register("speaker", self.audio_processor.load_speaker_model, enabled=self.diarization)
+        self.models.register("context", self.audio_processor.load_context_annotator, enabled=stages["context"])
+
+    def load_asr_model(self):
+        model = load_asr_model(self.config["asr"], cache_dir=self.config["model_cache_dir"])
+        self.scheduler.model = model
+        return model
+
+    def load_fallback_asr_model(self):
+        model = load_asr_model({**self.config["asr"], "model": self.config["asr"]["fallback_model"]},
+                               cache_dir=self.config["model_cache_dir"])
+        self.scheduler.fallback_model = model
+        return model
+
+    def start_models(self):
+        self.models.start()
+
     async def handle_connection(self, websocket):
+        session = Session(self, websocket)
+        self.sessions[session.id] = session
+        print(f"Client connected [{session.id}], {len(self.sessions)} active session(s).")
         try:
             async for message in websocket:
                     if isinstance(message, bytes):
-                        if self.audio_processor.is_speech(message, self.audio_processor.WHISPER_SAMPLE_RATE):
-                            self.phrase_time = datetime.utcnow() - self.start_time
-                            await self.audio_queue.put({"time": self.phrase_time, "audio": message})
+                        await session.receive_audio(message)
                     else:
-                        data = json.loads(message)
-                        action = data.get("action")
-                        match (action):
-                            case "startTranscription":
-                                print(message)
-                                print("Starting transcription.")
-                                # Ensure only one transcription task runs at a time
-                                if self.socket_task and not self.socket_task.done():
-                                    print("Transcription is already running.")
-                                    return
-                                
-                                # Start the transcription loop as a background task
-                                self.socket_task = asyncio.create_task(self.transcribe_loop())
-
-                            case "endTranscription":
-                                print(message)
-                                print("Ending transcription.")
-                                self.end_transcription()
-
-                                # Cancel the running socket_task if it exists
-                                if self.socket_task:
-                                    self.socket_task.cancel()
-                                    try:
-                                        await self.socket_task  # Ensure proper cancellation
-                                    except asyncio.CancelledError:
-                                        print("Transcription task successfully stopped.")
-                                    self.socket_task = None  # Clear reference to the task
+                        print(message)
+                        await session.handle_action(message)
 
         except websockets.ConnectionClosed:
-            print("Client disconnected.")
-
-    def update_transcription(self):
-        self.structured_transcription = self.parse_transcript(self.transcription_obj)
-
-    def end_transcription(self):
-        try:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            save_dir = os.path.join(current_dir, "transcriptions")
-            os.makedirs(save_dir, exist_ok=True)
-            file_name = "transcription_" + str(time.time()) + ".json"
-            file_path = os.path.join(save_dir, file_name)
-
-            context_transcription = []
-
-            for transcript in self.structured_transcription:
-                transcript['context'] = self.get_context(transcript['text'], context_transcription)
-                context_transcription.append(transcript)
-
-            with open(file_path, "w") as f:
-                json.dump(context_transcription, f, indent=4)
-
-            print(f"Saved to {file_path}") 
-        except Exception as e:
-            print(e)
-
-    def get_overlap(self, start1, end1, start2, end2):
-        """Calculate overlap duration between two time intervals."""
-        overlap = max(0, min(end1, end2) - max(start1, start2))
-        total_duration = min(end1 - start1, end2 - start2)  # Normalize by the shorter segment
-        return overlap / total_duration if total_duration > 0 else 0  # Return overlap ratio
-
-    def parse_transcript(self, transcription):
-        def parse_timestamp(ts):
-            """Convert timestamp (HH:MM:SS.sss) into seconds."""
-            h, m, s = map(float, ts.split(":"))
-            return h * 3600 + m * 60 + s
-
-        structured_transcript = []
-
-        for transcript_group in transcription:
-            for entry in transcript_group:
-                already_assigned = False
-                if not already_assigned:
-                    structured_transcript.append({
-                    #    "speaker": "UNKNOWN",  # Assign to UNKNOWN
-                        "start_time": entry["start"],
-                        "end_time": entry["end"],
-                        "text": entry["text"],
-                        "context": entry["context"]
-                    })
-
-        # Sort transcript chronologically by start time
-        structured_transcript.sort(key=lambda x: parse_timestamp(x["start_time"]))
-
-        return structured_transcript
-
-    def print_transcript(self):
-        print("\n[TRANSCRIPT]")
-        for entry in self.structured_transcription:
-                print(f"[{entry['start_time']}-{entry['end_time']}]: {entry['text']}")
-
-
-    def process_transcription(self):
-        self.update_transcription()
-        self.print_transcript() #print at the end (with the context added)
-
-    def get_context(self, last_transcription, transcription_history):
-        history = ''
-        if transcription_history:
-            recent_history = transcription_history[-4:-1]
-            history = ', '.join(obj['text'] for obj in recent_history)
-        return self.audio_processor.add_context_w_llm(last_transcription, f"[{history}]")
-
-    async def run_transcription(self, audio_data, start_time):
+            print(f"Client disconnected [{session.id}].")
+        finally:
+            await session.close()
+            del self.sessions[session.id]
+
+    def queue_stats(self):
+        """Queue depths used to tell when the server is falling behind the audio streams."""
+        return {
+            "sessions": {session_id: session.queue_stats() for session_id, session in self.sessions.items()},
+            "pending_windows": len(self.scheduler.pending),
+            "average_batch_size": self.scheduler.average_batch_size(),
+            "asr": self.scheduler.model.stats() if self.scheduler.model else None,
+            "inference": self.executor.stats(),
+            "load": self.load.stats()
+        }
+
+    def metrics_snapshot(self):
+        return {**self.metrics.snapshot(), "queues": self.queue_stats(), "models": self.models.readiness()}
+
+    def process_request(self, connection, request):
         """
-        Runs transcription asynchronously, returning formatted text.
+        Serves GET /health (per-model readiness; 503 until ASR is ready), GET /sessions
+        (per-session queues and memory) and GET /metrics as JSON on the websocket port.
+        Every other path is a websocket handshake, refused with 503 when the load
+        controller does not admit another session.
         """
-        audio_tensor = self.audio_processor.preprocess_audio(audio_data)
-        audio_tensor = torch.from_numpy(audio_tensor).to("cuda", non_blocking=True)
-
-        result = self.model.transcribe(audio_tensor)
-        segments = result.get("segments", [])
-        transcription_obj = self.audio_processor.process_time_segments(start_time, segments)
-
-        now = datetime.utcnow() - self.start_time
-        self.phrase_complete = self.phrase_time and now - self.phrase_time > timedelta(seconds=self.audio_processor.PHRASE_TIMEOUT)
-
-        self.transcription_obj[-1] = transcription_obj
-        if self.phrase_complete:
-            self.transcription_obj.append({})
-            self.batch_buffer.clear()  # Clear all processed transcription data
-
-        self.process_transcription()
-
-    async def transcribe_loop(self):
-        print("Starting transcription loop...")
-
-        phrase_timestamp = timedelta(0)
-        
-        while True:
-            while not self.audio_queue.empty():
-                data = await self.audio_queue.get()
-                audio_data = data["audio"]
-                if self.phrase_complete:
-                    phrase_timestamp = data["time"]
-                self.batch_buffer.extend(audio_data)
-            
-            self.phrase_complete = False
+        if request.path == "/health":
+            status = HTTPStatus.OK if self.models.ready("asr") else HTTPStatus.SERVICE_UNAVAILABLE
+            response = connection.respond(status, json.dumps({"models": self.models.readiness()}) + "\n")
+            response.headers["Content-Type"] = "application/json"
+            return response
+        if request.path == "/sessions":
+            response = connection.respond(HTTPStatus.OK, json.dumps(self.queue_stats(), default=str) + "\n")
+            response.headers["Content-Type"] = "application/json"
+            return response
+        if request.path != "/metrics":
+            if not self.load.admit(len(self.sessions)):
+                print(f"Refusing a connection: {len(self.sessions)} active session(s), load {self.load.stats()['level']}.")
+                return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "Server is at capacity, try again later\n")
+            return None
+        if not self.metrics.enabled:
+            return connection.respond(HTTPStatus.NOT_FOUND, "Metrics are disabled\n")
+        response = connection.respond(HTTPStatus.OK, json.dumps(self.metrics_snapshot(), default=str) + "\n")
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    async def end_all_sessions(self):
+        for session in list(self.sessions.values()):
+            await session.end_transcription()
 
-            if self.batch_buffer:
-                transcription_task = asyncio.create_task(self.run_transcription(self.batch_buffer, phrase_timestamp))
-                await transcription_task  # Process transcription without blocking
-                
-            await asyncio.sleep(0.1)
-    
     async def main(self):
-        async with websockets.serve(self.handle_connection, self.host, self.port):
+        report_task = None
+        if self.metrics.enabled and self.config["metrics"]["log_interval"]:
+            report_task = asyncio.create_task(self.metrics.report_loop(self.config["metrics"]["log_interval"], self.queue_stats))
+        self.start_models()  # Connections are accepted while models load
+        async with websockets.serve(self.handle_connection, self.host, self.port, process_request=self.process_request):
             print(f"Starting WebSocket server at ws://{self.host}:{self.port}")
-            await asyncio.Future()
+            try:
+                await asyncio.Future()
+            finally:
+                if report_task:
+                    report_task.cancel()
 
 if __name__ == "__main__":
     server = TranscriptionServer()
     try:
         asyncio.run(server.main())  # Run the event loop
     except KeyboardInterrupt:
-        server.end_transcription()
-        print("KeyboardInterrupt received, shutting down...")
\ No newline at end of file
+        asyncio.run(server.end_all_sessions())
+        print("KeyboardInterrupt received, shutting down...")
@@ -1,22 +1,192 @@
 import torch
 import whisper
 import torch.backends.cudnn as cudnn
+from dataclasses import replace
+from whisper.audio import HOP_LENGTH, SAMPLE_RATE
+from whisper.decoding import DecodingTask
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
 
 cudnn.benchmark = True
 
+class PromptedDecodingTask(DecodingTask):
+    """
+    whisper's DecodingTask with its own prompt tokens per row, so windows with
+    different prompts share one decoder pass. Every row's prompt must have the
+    same number of tokens: the task is built with the first row's prompt and the
+    others are written over it (after sot_prev) before sampling starts.
+    """
+    def __init__(self, model, options, prompts):
+        super().__init__(model, replace(options, prompt=prompts[0] or None))
+        self.row_prompts = prompts
+
+    def _main_loop(self, audio_features, tokens):
+        if self.row_prompts[0]:
+            prompts = torch.tensor(self.row_prompts, device=tokens.device).repeat_interleave(self.n_group, dim=0)
+            tokens[:, 1:1 + prompts.shape[1]] = prompts
+        return super()._main_loop(audio_features, tokens)
+
 class WhisperModel:
-    def __init__(self, model_name="turbo"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = whisper.load_model(model_name, device=self.device)
-    
-    def transcribe(self, audio_tensor):
-        return self.model.transcribe(
-            audio_tensor,
-            fp16=True,
-            logprob_threshold=-1.0,
-            no_speech_threshold=2.0,
-            hallucination_silence_threshold=1.0,
-            compression_ratio_threshold=1.0,
+    # Decode settings shared by transcribe() and transcribe_batch(), so a window is
+    # decoded the same way whatever batch it lands in
+    TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)  # Fallback schedule, as in whisper.transcribe
+    COMPRESSION_RATIO_THRESHOLD = 2.4  # Above this the output is likely repetitive
+    LOGPROB_THRESHOLD = -1.0
+    NO_SPEECH_THRESHOLD = 0.6  # Windows above this (and below LOGPROB_THRESHOLD) are silence
+    # A batched window's prompt is cut to the longest of these token counts it fills (shorter
+    # prompts are dropped), so windows from any number of sessions need at most one decoder
+    # pass per length, and the cut never depends on which other windows share the batch
+    PROMPT_TOKEN_BUCKETS = (32, 16, 8)
+
+    def __init__(self, model_name="turbo", device=None, fp16=None, download_root=None):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.fp16 = self.device == "cuda" if fp16 is None else fp16  # fp16 is not supported on CPU
+        self.model = whisper.load_model(model_name, device=self.device, download_root=download_root)
+        self.tokenizer = get_tokenizer(
+            self.model.is_multilingual,
+            num_languages=self.model.num_languages,
+            language="en",
+            task="transcribe"
+        )
+        self.decodes = 0
+        self.fallbacks = 0  # Windows that had to be re-decoded at a higher temperature
+        self.decoder_passes = 0  # Batched decoder runs; below decodes when windows share a pass
+
+    def transcribe(self, audio_tensor, initial_prompt=None, **options):
+        decode_options = dict(
+            fp16=self.fp16,
+            temperature=self.TEMPERATURES,
+            logprob_threshold=self.LOGPROB_THRESHOLD,
+            no_speech_threshold=self.NO_SPEECH_THRESHOLD,
+            # 1.0 flagged almost every window as repetitive and forced a re-decode at each temperature
+            compression_ratio_threshold=self.COMPRESSION_RATIO_THRESHOLD,
             language="en",
-            suppress_tokens=""
+            suppress_tokens="",
+            initial_prompt=initial_prompt
         )
+        decode_options.update(options)
+        result = self.model.transcribe(audio_tensor, **decode_options)
+        self.decodes += 1
+        if any(segment.get("temperature", 0.0) > 0 for segment in result["segments"]):
+            self.fallbacks += 1
+        return result
+
+    def is_silence(self, result):
+        """whisper.transcribe's rule for dropping a window: likely no speech and a low-confidence decode."""
+        return result.no_speech_prob > self.NO_SPEECH_THRESHOLD and result.avg_logprob < self.LOGPROB_THRESHOLD
+
+    def needs_fallback(self, result):
+        if self.is_silence(result):
+            return False  # A hotter decode of silence would not help
+        return result.compression_ratio > self.COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < self.LOGPROB_THRESHOLD
+
+    def prompt_tokens(self, prompt):
+        """The last tokens of a prompt, cut to a PROMPT_TOKEN_BUCKETS length."""
+        if not prompt:
+            return []
+        tokens = self.tokenizer.encode(" " + prompt.strip())
+        for length in self.PROMPT_TOKEN_BUCKETS:
+            if len(tokens) >= length:
+                return tokens[-length:]
+        return []
+
+    def transcribe_batch(self, windows, prompts=None, word_timestamps=False):
+        """
+        Decodes several windows (float32 arrays of at most 30 s) and returns
+        transcribe()-style results in the same order. `prompts` holds one
+        initial_prompt (or None) per window.
+
+        The encoder runs once for the whole batch. Windows are then decoded
+        together, each conditioned on its own prompt (see PromptedDecodingTask),
+        in one decoder pass per prompt length. Windows that fail the
+        compression/logprob checks are re-decoded at the next temperature from
+        the same audio features instead of being re-encoded. A single window
+        takes the same path, so the thresholds applied never depend on the batch
+        size; windows judged silent come back without segments.
+        """
+        prompts = [self.prompt_tokens(prompt) for prompt in prompts or [None] * len(windows)]
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.as_tensor(window)), self.model.dims.n_mels)
+            for window in windows
+        ]).to(self.model.device)
+
+        decoded = [None] * len(windows)
+        pending = list(range(len(windows)))
+        fell_back = set()
+        with torch.inference_mode():
+            audio_features = self.model.embed_audio(mels.half() if self.fp16 else mels)
+            for temperature in self.TEMPERATURES:
+                groups = {}
+                for i in pending:
+                    groups.setdefault(len(prompts[i]), []).append(i)
+
+                retry = []
+                options = whisper.DecodingOptions(language="en", fp16=self.fp16, suppress_tokens="", temperature=temperature)
+                for indices in groups.values():
+                    task = PromptedDecodingTask(self.model, options, [prompts[i] for i in indices])
+                    self.decoder_passes += 1
+                    for i, result in zip(indices, task.run(audio_features[indices])):
+                        decoded[i] = result
+                        if self.needs_fallback(result):
+                            retry.append(i)
+                if not retry or temperature == self.TEMPERATURES[-1]:
+                    break
+                fell_back.update(retry)
+                pending = retry
+        self.decodes += len(windows)
+        self.fallbacks += len(fell_back)
+
+        results = []
+        for window, mel, result in zip(windows, mels, decoded):
+            segments = [] if self.is_silence(result) else self.split_segments(result.tokens)
+            if word_timestamps and segments:
+                add_word_timestamps(
+                    segments=segments,
+                    model=self.model,
+                    tokenizer=self.tokenizer,
+                    mel=mel,
+                    num_frames=min(len(window), whisper.audio.N_SAMPLES) // HOP_LENGTH,
+                    last_speech_timestamp=0.0  # Window start; each window is aligned on its own
+                )
+            results.append({"text": "".join(segment["text"] for segment in segments), "segments": segments,
+                            "language": "en", "temperature": result.temperature})
+        return results
+
+    def stats(self):
+        return {"decodes": self.decodes, "fallbacks": self.fallbacks, "decoder_passes": self.decoder_passes}
+
+    def split_segments(self, tokens):
+        """Splits decoded tokens into segments at timestamp token pairs."""
+        timestamp_begin = self.tokenizer.timestamp_begin
+        time_precision = HOP_LENGTH * 2 / SAMPLE_RATE  # 20 ms per timestamp token
+
+        segments = []
+        start = None
+        text_tokens = []
+        for token in tokens:
+            if token >= timestamp_begin:
+                time = (token - timestamp_begin) * time_precision
+                if start is None:
+                    start = time
+                elif text_tokens:
+                    segments.append(self.make_segment(len(segments), start, time, text_tokens))
+                    start, text_tokens = None, []
+                else:
+                    start = time
+            else:
+                text_tokens.append(token)
+
+        if text_tokens:  # Trailing text without a closing timestamp
+            segments.append(self.make_segment(len(segments), start or 0.0, start or 0.0, text_tokens))
+        return segments
+
+    def make_segment(self, segment_id, start, end, text_tokens):
+        return {
+            "id": segment_id,
+            "seek": 0,
+            "start": start,
+            "end": end,
+            "text": self.tokenizer.decode(text_tokens),
+            "tokens": text_tokens
+        }